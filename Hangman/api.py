@@ -5,29 +5,126 @@ move game logic to another file. Ideally the API will be simple, concerned
 primarily with communication to/from the API's users."""
 
 
+import functools
+import hashlib
+import httplib
 import logging
+from datetime import date, datetime, timedelta
 import endpoints
 from protorpc import remote, messages
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
-
-from models import User, Game, Score
+from google.appengine.api import datastore_errors
+
+import compaction
+import counters
+import engine
+import gamecache
+import instrumentation
+import leaderboard
+import ratelimit
+from models import User, Game, Score, ActiveGames, normalize_name, \
+    ACTIVE_GAMES_COUNTER, ACTIVE_ATTEMPTS_COUNTER, MAX_ACTIVE_GAMES, \
+    TooManyGamesError
 from models import StringMessage, NewGameForm, GameForm, MakeMoveForm,\
-    ScoreForms, UserGamesForm, DeleteGameForm, ScoreBoard, UserRankingForm, \
-    MultiUserRankingForm, GameHistoryForm
-from utils import get_by_urlsafe
+    ScoreForm, ScoreForms, UserGamesForm, DeleteGameForm, ScoreBoard, \
+    MakeMovesForm, MoveForm, MovesForm, NewGamesForm, GameForms, \
+    UserRankingForm, MultiUserRankingForm, GameHistoryForm, CacheStatsForm, \
+    CountForm, EndpointStatsForm, EndpointStatsForms, ThrottleStatsForm, \
+    ScoreColumnsForm
+from instrumentation import instrumented
+from utils import get_key_by_urlsafe, next_batch
+from words import DIFFICULTIES, NoWordsError, UnknownDictionaryError, \
+    UnknownDifficultyError
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
+NEW_GAMES_REQUEST = endpoints.ResourceContainer(NewGamesForm)
 GET_GAME_REQUEST = endpoints.ResourceContainer(
         urlsafe_game_key=messages.StringField(1),)
 MAKE_MOVE_REQUEST = endpoints.ResourceContainer(MakeMoveForm,
         urlsafe_game_key=messages.StringField(1),)
+MAKE_MOVES_REQUEST = endpoints.ResourceContainer(MakeMovesForm,
+        urlsafe_game_key=messages.StringField(1),)
+HISTORY_REQUEST = endpoints.ResourceContainer(
+        urlsafe_game_key=messages.StringField(1),
+        start=messages.IntegerField(2, default=0),
+        page_size=messages.IntegerField(3),
+        at_move=messages.IntegerField(4),
+        compact=messages.BooleanField(5, default=False),
+        etag=messages.StringField(6))
 USER_REQUEST = endpoints.ResourceContainer(user_name=messages.StringField(1),
                                            email=messages.StringField(2))
 SCORE_BOARD_REQUEST = endpoints.ResourceContainer(
-        number_of_results=messages.IntegerField(1))
-
-MEMCACHE_MOVES_REMAINING = 'MOVES_REMAINING'
+        number_of_results=messages.IntegerField(1),
+        board=messages.StringField(2, default='all'),
+        date=messages.StringField(3),
+        cursor=messages.StringField(4),
+        compact=messages.BooleanField(5, default=False),
+        etag=messages.StringField(6))
+PAGE_REQUEST = endpoints.ResourceContainer(
+        page_size=messages.IntegerField(1),
+        cursor=messages.StringField(2),
+        compact=messages.BooleanField(3, default=False),
+        etag=messages.StringField(4))
+USER_PAGE_REQUEST = endpoints.ResourceContainer(
+        user_name=messages.StringField(1),
+        page_size=messages.IntegerField(2),
+        cursor=messages.StringField(3),
+        compact=messages.BooleanField(4, default=False),
+        etag=messages.StringField(5))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_GUESSES = 100
+MAX_NEW_GAMES = 5000
+# Games of one user saved in one transaction by new_games
+MAX_ROUNDS = 50
+# Errors of Game.new_game and Game.new_games caused by the request
+NEW_GAME_ERRORS = (ValueError, UnknownDictionaryError, UnknownDifficultyError,
+                   NoWordsError, TooManyGamesError)
+
+# Message returned for each engine outcome, formatted with the obscured target
+MOVE_MESSAGES = {
+    engine.GAME_OVER: 'Game already over!',
+    engine.NOT_ONE_LETTER: 'Valid guesses are one letter only!',
+    engine.NOT_A_LETTER: 'Letters only!',
+    engine.ALREADY_FOUND: 'You already got that letter! This is what you '
+                          'have left: {}',
+    engine.ALREADY_TRIED: 'You already tried that letter! This is what you '
+                          'have left: {}',
+    engine.CORRECT: 'Nice! This is what you have left: {}',
+    engine.WRONG: 'Try again! This is what you have left: {}',
+    engine.WON: 'You win!',
+    engine.LOST: 'Game over!',
+}
+
+
+class ThrottledException(endpoints.ServiceException):
+    """Too many requests were made on a game or by its player. The message
+    says when to retry."""
+    http_status = httplib.SERVICE_UNAVAILABLE
+
+
+class ContentionException(endpoints.ServiceException):
+    """The game was being changed by other requests and the request can be
+    retried"""
+    http_status = httplib.SERVICE_UNAVAILABLE
+
+
+def _etag(*parts):
+    """Returns the ETag of a response made from parts"""
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+
+def retryable(method):
+    """Decorator for endpoint methods on one game, answering contention on
+    the game's entity group with a ContentionException"""
+    @functools.wraps(method)
+    def wrapper(service, request):
+        try:
+            return method(service, request)
+        except (datastore_errors.TransactionFailedError,
+                datastore_errors.Timeout):
+            ratelimit.count('contention')
+            raise ContentionException('The game is busy, please retry.')
+    return wrapper
 
 @endpoints.api(name='hangman', version='v1')
 class HangmanApi(remote.Service):
@@ -37,15 +134,17 @@ class HangmanApi(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @instrumented
     def create_user(self, request):
         """Create a User. Requires a unique username"""
-        if request.user_name is None:
+        if not request.user_name:
             raise endpoints.BadRequestException('User name is required!')
-        if User.query(User.name == request.user_name).get():
+        # Until the name index is complete, get_by_name also finds and
+        # indexes a user created before it
+        if User.get_by_name(request.user_name) or not User.create(
+                request.user_name, request.email):
             raise endpoints.ConflictException(
                     'A User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
         return StringMessage(message='User {} created!'.format(
                 request.user_name))
 
@@ -54,38 +153,88 @@ class HangmanApi(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
+    @instrumented
     def new_game(self, request):
         """Creates new game"""
-        user = User.query(User.name == request.user_name).get()
+        user = User.get_by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
         try:
-            game = Game.new_game(user.key, request.min, request.max)
-        except ValueError:
-            raise endpoints.BadRequestException('Maximum must be greater '
-                                                'than minimum!')
+            game = Game.new_game(user, request.min, request.max,
+                                 request.dictionary, request.difficulty)
+        except NEW_GAME_ERRORS as error:
+            raise self._new_game_error(request, error)
 
-        # Use a task queue to update the average attempts remaining.
-        # This operation is not needed to complete the creation of a new game
-        # so it is performed out of sequence.
-        taskqueue.add(url='/tasks/cache_average_attempts')
         return game.to_form('Good luck playing Hangman!')
 
-    @endpoints.method(request_message=USER_REQUEST,
+    @endpoints.method(request_message=NEW_GAMES_REQUEST,
+                      response_message=GameForms,
+                      path='games',
+                      name='new_games',
+                      http_method='POST')
+    @instrumented
+    def new_games(self, request):
+        """Creates games for several users in rounds, every player getting
+        the same word in a round"""
+        if not request.user_names:
+            raise endpoints.BadRequestException('User names are required!')
+        if (len(set(normalize_name(name) for name in request.user_names)) !=
+                len(request.user_names)):
+            raise endpoints.BadRequestException('User names must be unique!')
+        if not 0 < request.rounds <= MAX_ROUNDS:
+            raise endpoints.BadRequestException(
+                    'Rounds must be between 1 and {}!'.format(MAX_ROUNDS))
+        if len(request.user_names) * request.rounds > MAX_NEW_GAMES:
+            raise endpoints.BadRequestException(
+                    'At most {} games can be created at once!'.format(
+                        MAX_NEW_GAMES))
+        users = User.get_by_names(request.user_names)
+        missing = [name for name, user in zip(request.user_names, users)
+                   if not user]
+        if missing:
+            raise endpoints.NotFoundException(
+                    'No Users with the names {}!'.format(', '.join(missing)))
+        try:
+            games = Game.new_games(users, request.rounds, request.min,
+                                   request.max, request.dictionary,
+                                   request.difficulty)
+        except NEW_GAME_ERRORS as error:
+            raise self._new_game_error(request, error)
+        except (datastore_errors.TransactionFailedError,
+                datastore_errors.Timeout):
+            ratelimit.count('contention')
+            raise ContentionException(
+                'Some users were busy, please retry. The games of the other '
+                'users may have been created, check their games first.')
+
+        return GameForms(games=[game.to_form('Good luck playing Hangman!')
+                                for game in games])
+
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=UserGamesForm,
                       path='games/user/{user_name}',
                       name='get_user_games',
                       http_method='GET')
+    @instrumented
     def get_user_games(self, request):
-        """Return all active games for a user"""
-        user = User.query(User.name == request.user_name).get()
+        """Return a page of a user's active games"""
+        user = User.get_by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-        games = Game.query(ancestor=user.key).filter(Game.game_over != True)
+        summary = ActiveGames.get_for_async(user.key).get_result()
+        page_size = self._page_size(request.page_size)
+        if request.cursor and not request.cursor.isdigit():
+            raise endpoints.BadRequestException('Invalid cursor!')
+        offset = int(request.cursor or 0)
+        games = summary.games[offset:offset + page_size]
+        offset += len(games)
 
-        return UserGamesForm(games=[game.to_user_games_form() for game in games])
+        return UserGamesForm(games=[game.to_form(user.name) for game in games],
+                             next_cursor=(str(offset)
+                                          if offset < len(summary.games)
+                                          else None))
 
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
@@ -93,20 +242,16 @@ class HangmanApi(remote.Service):
                       path='game/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @instrumented
+    @retryable
     def get_game(self, request):
         """Return the current game state."""
-        try:
-            game = get_by_urlsafe(request.urlsafe_game_key, Game)
-            is_game_over = game.game_over
-
-            if is_game_over:
-                return game.to_form('Game Over!')
-            elif not is_game_over:
-                return game.to_form('Time to make a move!')
-            else:
-                raise endpoints.NotFoundException('Game not found!')
-        except Exception:
-            raise endpoints.BadRequestException('Invalid key, please try a real key.')
+        game = gamecache.get(self._game_key(request.urlsafe_game_key))
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+        if game.game_over:
+            return game.to_form('Game Over!')
+        return game.to_form('Time to make a move!')
 
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
@@ -114,19 +259,19 @@ class HangmanApi(remote.Service):
                       path='game/{urlsafe_game_key}/delete',
                       name='cancel_game',
                       http_method='GET')
+    @instrumented
+    @retryable
     def cancel_game(self, request):
         """Return the current game state."""
-        try:
-            game = get_by_urlsafe(request.urlsafe_game_key, Game)
-            if game.game_over is False:
-                delete_confirmation = game.deleted_game_form(message='Game cancelled!')
-                game.key.delete()
-                return delete_confirmation
-            else:
-                return game.deleted_game_form(message='Game is already over.' \
-                                              ' Cannot cancel.')
-        except Exception:
-            raise endpoints.BadRequestException('Invalid key, please try a real key.')
+        game = gamecache.get(self._game_key(request.urlsafe_game_key))
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+        # cancel() checks again that the game is not over
+        if game.game_over is False and game.cancel():
+            return game.deleted_game_form(message='Game cancelled!')
+        else:
+            return game.deleted_game_form(message='Game is already over.' \
+                                          ' Cannot cancel.')
 
 
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
@@ -134,106 +279,132 @@ class HangmanApi(remote.Service):
                       path='game/{urlsafe_game_key}',
                       name='make_move',
                       http_method='PUT')
+    @instrumented
+    @retryable
     def make_move(self, request):
         """Makes a move. Returns a game state with message"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        # Temporary lists
-        answer_as_list = list(game.target)
-        hidden_answer_as_list = list(game.obscured_target)
+        key = self._game_key(request.urlsafe_game_key)
+        game = gamecache.get(key)
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
 
-        # Game is already over, no need to do anything but let the user know
-        if game.game_over:
-            return game.to_form('Game already over!')
-
-        # Check if guess is 1 character long
-        if len(request.guess) == 1:
-            # Once we know that guess is correct length, check if its a letter
-            if request.guess.isalpha():
-                # Guess is confirmed good by previous logic
-                # Answer is lowercase, so make the guess lowercase
-                guess = request.guess.lower()
-                # Check if guess is in word, and if it's already been found
-                if guess in game.target and guess not in game.obscured_target:
-                    for index in range(len(answer_as_list)):
-                        if answer_as_list[index] == guess:
-                            hidden_answer_as_list[index] = guess
-                            # Add to correct letters string
-                            if guess not in game.correct_letters:
-                                game.correct_letters = (game.correct_letters +
-                                                        guess)
-                    # Update game properties with found letter
-                    game.obscured_target = ''.join(hidden_answer_as_list)
-                    game.all_guesses = game.all_guesses + guess
-                    # Since $ is not a letter, we can safely say that if there is a $ char
-                    # in the current game, the game is ongoing. If not, it's over.
-                    if "$" not in game.obscured_target:
-                        game.end_game(True)
-                        return game.to_form('You win!')
-                    else:
-                        # Update game entity and give user updated word status
-                        game.put()
-                        return game.to_form('Nice! This is what you have left: %s' % game.obscured_target)
-                # Let user know they already found letter. No attempt penalty.
-                elif guess in game.obscured_target:
-                    return game.to_form('You already got that letter! This is what you have left: %s' % game.obscured_target)
-                # Let user know they already tried letter. No attempt penalty.
-                elif guess in game.tried_letters_were_wrong:
-                    return game.to_form('You already tried that letter! This is what you have left: %s' % game.obscured_target)
-                # Guess wrong, reduce tries left, add guess to string of tries
-                else:
-                    game.all_guesses = game.all_guesses + guess
-                    game.tried_letters_were_wrong = game.tried_letters_were_wrong + guess
-                    game.attempts_remaining -= 1
-                # Is game over? Let's check.
-                if game.attempts_remaining < 1:
-                    game.end_game(False)
-                    return game.to_form('Game over!')
-                # Update game entity, let user know guess wrong.
-                else:
-                    game.put()
-                    return game.to_form('Try again! This is what you have left: %s' % game.obscured_target)
-            else:
-                return game.to_form('Letters only!')
-        else:
-            return game.to_form('Valid guesses are one letter only!')
+        # Repeated or invalid guesses don't change the game, so they are
+        # answered from the cached game. Only accepted guesses are applied
+        # again, in a transaction, to the saved game.
+        outcome = game.apply_guess(request.guess)
+        if outcome in engine.ACCEPTED:
+            game, outcome = Game.make_move(key, request.guess)
+            if not game:
+                raise endpoints.NotFoundException('Game not found!')
+        return game.to_form(MOVE_MESSAGES[outcome].format(
+                game.obscured_target))
 
 
-    @endpoints.method(request_message=GET_GAME_REQUEST,
+    @endpoints.method(request_message=MAKE_MOVES_REQUEST,
+                      response_message=MovesForm,
+                      path='game/{urlsafe_game_key}/moves',
+                      name='make_moves',
+                      http_method='PUT')
+    @instrumented
+    @retryable
+    def make_moves(self, request):
+        """Makes several moves in order, stopping when the game ends. Returns
+        the message of each move made and the final game state"""
+        if not request.guesses:
+            raise endpoints.BadRequestException('Guesses are required!')
+        if len(request.guesses) > MAX_GUESSES:
+            raise endpoints.BadRequestException(
+                    'At most {} guesses are allowed!'.format(MAX_GUESSES))
+        key = self._game_key(request.urlsafe_game_key)
+        game = gamecache.get(key)
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+
+        # Like make_move, only a transaction when some guess changes the game
+        moves = game.apply_guesses(request.guesses)
+        if any(outcome in engine.ACCEPTED for outcome, _ in moves):
+            game, moves = Game.make_moves(key, request.guesses)
+            if not game:
+                raise endpoints.NotFoundException('Game not found!')
+        forms = [MoveForm(guess=guess,
+                          message=MOVE_MESSAGES[outcome].format(obscured))
+                 for guess, (outcome, obscured) in zip(request.guesses, moves)]
+        return MovesForm(moves=forms, game=game.to_form(forms[-1].message))
+
+
+    @endpoints.method(request_message=HISTORY_REQUEST,
                       response_message=GameHistoryForm,
                       path='game/{urlsafe_game_key}/history',
                       name='get_game_history',
                       http_method='GET')
+    @instrumented
     def get_game_history(self, request):
-        """Return the current game history."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-
-        if game:
-            return game.to_game_history_form()
-        else:
+        """Return a page of the game history, as of a move if at_move is
+        given."""
+        if request.start < 0 or (request.at_move is not None and
+                                 request.at_move < 0):
+            raise endpoints.BadRequestException('Moves are numbered from 0!')
+        page_size = self._page_size(request.page_size, None)
+        game = gamecache.get(get_key_by_urlsafe(request.urlsafe_game_key,
+                                                Game))
+        if not game:
             raise endpoints.NotFoundException('Game not found!')
 
+        # Every save of a game changes its version
+        etag = _etag(game.key.urlsafe(), game.version, request.start,
+                     page_size, request.at_move, request.compact)
+        if self._not_modified(request, etag):
+            return GameHistoryForm(urlsafe_key=request.urlsafe_game_key,
+                                   etag=etag, not_modified=True)
+        form = game.to_game_history_form(request.start, page_size,
+                                         request.at_move, request.compact)
+        form.etag = etag
+        return form
+
 
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @instrumented
     def get_scores(self, request):
-        """Return all scores"""
+        """Return a page of all scores"""
+        scores, next_cursor = self._fetch_page(Score.query(),
+                                               request.page_size,
+                                               request.cursor)
 
-        return ScoreForms(scores=[score.to_form()
-                              for score in Score.query()])
+        return self._score_list(ScoreForms, 'scores',
+                                [score.to_form() for score in scores],
+                                next_cursor, request)
 
 
-    @endpoints.method(response_message=MultiUserRankingForm,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=MultiUserRankingForm,
                       path='userrankings',
                       name='get_user_rankings',
                       http_method='GET')
+    @instrumented
     def get_user_rankings(self, request):
         """Return user rankings"""
-        users = User.query().order(-User.user_score)
-
-        return MultiUserRankingForm(rankings=[user.to_user_ranking_form()
-                                    for user in users])
+        entries, next_cursor = self._leaderboard_page(
+            leaderboard.USERS, request.page_size, request.cursor)
+
+        user_names = [entry['user_name'] for entry in entries]
+        user_scores = [entry['user_score'] for entry in entries]
+        etag = _etag(request.compact, next_cursor, user_names, user_scores)
+        if self._not_modified(request, etag):
+            return MultiUserRankingForm(etag=etag, not_modified=True)
+        if request.compact:
+            return MultiUserRankingForm(user_names=user_names,
+                                        user_scores=user_scores,
+                                        next_cursor=next_cursor, etag=etag)
+        return MultiUserRankingForm(
+            rankings=[UserRankingForm(user_name=user_name,
+                                      user_score=user_score)
+                      for user_name, user_score in zip(user_names,
+                                                       user_scores)],
+            next_cursor=next_cursor, etag=etag)
 
 
     @endpoints.method(request_message=SCORE_BOARD_REQUEST,
@@ -241,54 +412,231 @@ class HangmanApi(remote.Service):
                       path='scoreboard',
                       name='get_high_scores',
                       http_method='GET')
+    @instrumented
     def get_high_scores(self, request):
-        """Return score board"""
+        """Return score board. Past its top 100, the all time board only holds
+        the scores of the last 35 days, older ones are rolled up."""
         if request.number_of_results == 0:
             raise endpoints.BadRequestException('Limit cannot be zero!')
-        else:
-            scores = Score.query().order(-Score.game_score).fetch(
-                        request.number_of_results)
-            return ScoreBoard(high_scores=[score.to_form() for score in scores])
-
-
-    @endpoints.method(request_message=USER_REQUEST,
+        try:
+            day = (datetime.strptime(request.date, '%Y-%m-%d').date()
+                   if request.date else date.today())
+        except ValueError:
+            raise endpoints.BadRequestException('Dates must be YYYY-MM-DD!')
+        if request.board not in ('all', 'day', 'week'):
+            raise endpoints.BadRequestException(
+                    'Board must be one of all, day or week!')
+        board = leaderboard.SCORES
+        if request.board != 'all':
+            # Boards are built from Scores, which are rolled up after the
+            # retention period, and boards of later days would be saved empty
+            oldest = date.today() - timedelta(
+                days=compaction.SCORE_RETENTION_DAYS)
+            start = day
+            if request.board == 'week':
+                start -= timedelta(days=day.weekday())
+            if not oldest <= start <= date.today():
+                raise endpoints.BadRequestException(
+                    'Date must be within the last {} days, and so must the '
+                    'Monday of a week!'.format(
+                        compaction.SCORE_RETENTION_DAYS))
+            board = (leaderboard.day_board(day) if request.board == 'day'
+                     else leaderboard.week_board(day))
+        entries, next_cursor = self._leaderboard_page(
+            board, request.number_of_results, request.cursor)
+
+        return self._score_list(ScoreBoard, 'high_scores',
+                                [ScoreForm(user_name=entry['user_name'],
+                                           date=entry['date'],
+                                           won=entry['won'],
+                                           game_score=entry['game_score'])
+                                 for entry in entries],
+                                next_cursor, request)
+
+
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=ScoreForms,
                       path='scores/user/{user_name}',
                       name='get_user_scores',
                       http_method='GET')
+    @instrumented
     def get_user_scores(self, request):
-        """Returns all of an individual User's scores"""
-        user = User.query(User.name == request.user_name).get()
+        """Returns a page of an individual User's scores"""
+        user = User.get_by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-        scores = Score.query(Score.user == user.key)
-        if scores.get() is not None:
-            return ScoreForms(scores=[score.to_form() for score in scores])
-        else:
+        # The user is known, the rest of the form is read from the index
+        scores, next_cursor = self._fetch_page(
+            Score.query(Score.user == user.key), request.page_size,
+            request.cursor, projection=[Score.date, Score.won,
+                                        Score.game_score])
+        if not scores and not request.cursor:
             raise endpoints.NotFoundException('User has no scores at this time.')
 
+        return self._score_list(ScoreForms, 'scores',
+                                [score.to_form(user.name) for score in scores],
+                                next_cursor, request)
+
 
     @endpoints.method(response_message=StringMessage,
                       path='games/average_attempts',
                       name='get_average_attempts_remaining',
                       http_method='GET')
+    @instrumented
     def get_average_attempts(self, request):
-        """Get the cached average moves remaining"""
-        return StringMessage(message=memcache.get(MEMCACHE_MOVES_REMAINING) or '')
+        """Get the average moves remaining from the running totals"""
+        # Both totals are read in the same memcache call
+        count_future = counters.get_count_async(ACTIVE_GAMES_COUNTER)
+        attempts_future = counters.get_count_async(ACTIVE_ATTEMPTS_COUNTER)
+        count = count_future.get_result()
+        if count <= 0:
+            return StringMessage(message='')
+        average = float(attempts_future.get_result())/count
+        return StringMessage(message='The average moves remaining is '
+                                     '{:.2f}'.format(average))
+
+
+    @endpoints.method(response_message=CacheStatsForm,
+                      path='stats/game_cache',
+                      name='get_game_cache_stats',
+                      http_method='GET')
+    @instrumented
+    def get_game_cache_stats(self, request):
+        """Get the hit and miss counts of the game cache"""
+        hits, misses = gamecache.stats()
+        return CacheStatsForm(hits=hits, misses=misses)
+
+
+    @endpoints.method(response_message=ThrottleStatsForm,
+                      path='stats/throttle',
+                      name='get_throttle_stats',
+                      http_method='GET')
+    @instrumented
+    def get_throttle_stats(self, request):
+        """Get the counts of requests allowed and throttled by the rate
+        limits on games and players, and of contention errors"""
+        return ThrottleStatsForm(**ratelimit.stats())
+
+
+    @endpoints.method(response_message=EndpointStatsForms,
+                      path='stats/endpoints',
+                      name='get_endpoint_stats',
+                      http_method='GET')
+    def get_endpoint_stats(self, request):
+        """Get the wall time and RPCs of the requests sampled on the instance
+        serving this request, per endpoint. Admins reset them at
+        /tasks/reset_endpoint_stats."""
+        forms = []
+        totals = instrumentation.stats()
+        for endpoint, total in sorted(totals.items()):
+            calls = total['calls']
+            forms.append(EndpointStatsForm(
+                endpoint=endpoint, calls=calls,
+                average_ms=total['total_ms'] / calls, max_ms=total['max_ms'],
+                counts=[CountForm(name=name, average=float(count) / calls)
+                        for name, count in sorted(total['counts'].items())]))
+        return EndpointStatsForms(endpoints=forms,
+                                  sample_rate=instrumentation.SAMPLE_RATE)
 
 
     @staticmethod
-    def _cache_average_attempts():
-        """Populates memcache with the average moves remaining of Games"""
-        games = Game.query(Game.game_over == False).fetch()
-        if games:
-            count = len(games)
-            total_attempts_remaining = sum([game.attempts_remaining
-                                        for game in games])
-            average = float(total_attempts_remaining)/count
-            memcache.set(MEMCACHE_MOVES_REMAINING,
-                         'The average moves remaining is {:.2f}'.format(average))
+    def _game_key(urlsafe):
+        """Returns the key of a game after taking a token from the rate
+        limits of the game and its player"""
+        try:
+            key = get_key_by_urlsafe(urlsafe, Game)
+        except (ValueError, endpoints.BadRequestException):
+            raise endpoints.BadRequestException(
+                'Invalid key, please try a real key.')
+        try:
+            ratelimit.check(key)
+        except ratelimit.Throttled as throttled:
+            raise ThrottledException('{}, retry in {:.1f} seconds.'.format(
+                throttled, throttled.retry_after))
+        return key
+
+    def _not_modified(self, request, etag):
+        """Returns True if the client sent the ETag of the response, in the
+        etag field or an If-None-Match header, and already has it"""
+        sent = request.etag
+        request_state = getattr(self, 'request_state', None)
+        if sent is None and request_state is not None:
+            sent = request_state.headers.get('If-None-Match')
+        return sent is not None and sent.strip('"') == etag
+
+    def _score_list(self, message_type, field, forms, next_cursor, request):
+        """Returns a ScoreForms or ScoreBoard holding forms in field, or
+        their columns if the request is compact, or only the ETag if the
+        client already has the response. The ETag is a hash of the forms, so
+        it saves sending them but not building them."""
+        etag = _etag(request.compact, next_cursor,
+                     [(form.user_name, form.date, form.won, form.game_score)
+                      for form in forms])
+        if self._not_modified(request, etag):
+            return message_type(etag=etag, not_modified=True)
+        message = message_type(next_cursor=next_cursor, etag=etag)
+        if request.compact:
+            message.columns = ScoreColumnsForm(
+                user_names=[form.user_name for form in forms],
+                dates=[form.date for form in forms],
+                won=[form.won for form in forms],
+                game_scores=[form.game_score for form in forms])
+        else:
+            setattr(message, field, forms)
+        return message
+
+    @staticmethod
+    def _new_game_error(request, error):
+        """Returns the BadRequestException for an error of NEW_GAME_ERRORS
+        raised creating the games of a request"""
+        if isinstance(error, UnknownDictionaryError):
+            return endpoints.BadRequestException(
+                    'There is no dictionary named {}!'.format(
+                        request.dictionary))
+        if isinstance(error, UnknownDifficultyError):
+            return endpoints.BadRequestException(
+                    'Difficulty must be one of {}!'.format(
+                        ', '.join(DIFFICULTIES)))
+        if isinstance(error, TooManyGamesError):
+            return endpoints.BadRequestException(
+                    'A user can have at most {} active games!'.format(
+                        MAX_ACTIVE_GAMES))
+        if isinstance(error, NoWordsError):
+            return endpoints.BadRequestException(
+                    'No words are between {} and {} letters long!'.format(
+                        request.min, request.max))
+        return endpoints.BadRequestException('Maximum must be greater than '
+                                             'minimum!')
+
+    @staticmethod
+    def _page_size(page_size, default=DEFAULT_PAGE_SIZE):
+        """Returns a requested page size, or the default if there was none"""
+        if page_size is None:
+            return default
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                    'Page size must be between 1 and {}!'.format(MAX_PAGE_SIZE))
+        return page_size
+
 
+    @staticmethod
+    def _fetch_page(query, page_size, cursor, **options):
+        """Returns a page of query results and the cursor of the next page"""
+        try:
+            return next_batch(query, cursor, HangmanApi._page_size(page_size),
+                              **options)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid cursor!')
+
+
+    @staticmethod
+    def _leaderboard_page(board, page_size, cursor):
+        """Returns a page of a leaderboard and the cursor of the next page"""
+        page_size = HangmanApi._page_size(page_size, leaderboard.SIZE)
+        try:
+            return leaderboard.page(board, page_size, cursor)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid cursor!')
 
 api = endpoints.api_server([HangmanApi])
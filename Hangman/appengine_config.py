@@ -0,0 +1,10 @@
+"""appengine_config.py - Makes the third party libraries installed in lib/
+importable, e.g. the cloudstorage library used by bulk.py:
+`pip install -t lib GoogleAppEngineCloudStorageClient`"""
+
+import os
+
+from google.appengine.ext import vendor
+
+if os.path.isdir(os.path.join(os.path.dirname(__file__), 'lib')):
+    vendor.add('lib')
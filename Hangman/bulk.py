@@ -0,0 +1,228 @@
+"""bulk.py - Bulk export and import of Users, DailyScores, Games and Scores.
+
+An export is a chain of tasks, each writing one batch of entities to its own
+newline-delimited JSON file in Cloud Storage, named after the export, kind
+and part number:
+
+    /<bucket>/exports/<export>/<Kind>-<part>.ndjson
+
+Each line is one entity: its key as a flat list of kinds and ids, and its
+properties. Keys are written without the app id, so an export can be imported
+into another app. Only one batch is held in memory at a time, and every task
+saves the cursor reached on the BulkJob of the export. A stopped export is
+resumed from its last checkpoint, and a retried task rewrites the same file.
+
+An import reads back the files of an export one task per file, in the order
+they were written, saving batches of entities with put_multi. It also adds
+the users to the UserName index, leaving out names already taken by another
+user. Active game totals and leaderboards are worked out from the saved
+entities by the reconcile cron and the leaderboard tasks, not imported.
+
+Needs the Cloud Storage client library (cloudstorage), installed in lib/."""
+
+import base64
+import json
+import logging
+from datetime import date, datetime
+
+from google.appengine.api import app_identity
+from google.appengine.ext import ndb
+
+try:
+    import cloudstorage as gcs
+except ImportError:
+    gcs = None
+
+import gamecache
+from models import User, UserName, DailyScore, Game, Score, normalize_name
+from utils import add_named_task, next_batch
+
+KINDS = (User, DailyScore, Game, Score)
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+QUEUE_URL = '/tasks/bulk'
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class BulkJob(ndb.Model):
+    """Progress of an export or import, keyed by 'export-<name>' or
+    'import-<name>'. kind is the position in KINDS of the kind being
+    exported, part the number of files written or read so far."""
+    kind = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    part = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    rows = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    done = ndb.BooleanProperty(required=True, default=False, indexed=False)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+def _bucket():
+    if gcs is None:
+        raise RuntimeError('The cloudstorage library is not installed')
+    return app_identity.get_default_gcs_bucket_name()
+
+
+def _folder(name):
+    return '/{}/exports/{}/'.format(_bucket(), name)
+
+
+def _part_path(name, model, part):
+    return '{}{}-{:05d}.ndjson'.format(_folder(name), model._get_kind(), part)
+
+
+def _encode(prop, value):
+    if value is None:
+        return None
+    if isinstance(value, ndb.Key):
+        return value.flat()
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    if type(prop) is ndb.BlobProperty:
+        return base64.b64encode(value)
+    return value
+
+
+def _decode(prop, value):
+    if value is None:
+        return None
+    if isinstance(prop, ndb.KeyProperty):
+        return ndb.Key(flat=value)
+    if isinstance(prop, ndb.DateProperty):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    if isinstance(prop, ndb.DateTimeProperty):
+        return datetime.strptime(value, DATETIME_FORMAT)
+    if type(prop) is ndb.BlobProperty:
+        return base64.b64decode(value)
+    return value
+
+
+def to_row(entity):
+    """Returns the JSON line of an entity"""
+    row = {'key': entity.key.flat()}
+    for name, prop in entity._properties.iteritems():
+        value = prop._get_value(entity)
+        row[name] = ([_encode(prop, item) for item in value]
+                     if prop._repeated else _encode(prop, value))
+    return json.dumps(row, separators=(',', ':'))
+
+
+def from_row(model, line):
+    """Returns the entity of a JSON line written by to_row"""
+    row = json.loads(line)
+    entity = model(key=ndb.Key(flat=row.pop('key')))
+    for name, value in row.iteritems():
+        prop = model._properties.get(name)
+        if prop is None:
+            continue
+        prop._set_value(entity, [_decode(prop, item) for item in value]
+                        if prop._repeated else _decode(prop, value))
+    return entity
+
+
+def start_export(name):
+    """Starts an export, or resumes it from its last checkpoint"""
+    job = BulkJob.get_or_insert('export-' + name)
+    if not job.done:
+        add_named_task('export-{}-{}-{}'.format(name, job.kind, job.part),
+                       QUEUE_URL + '/export', {'name': name})
+
+
+def export_batch(name):
+    """Writes the next batch of the export to a file and queues the next
+    batch"""
+    job = BulkJob.get_by_id('export-' + name)
+    if job is None or job.done:
+        return
+    model = KINDS[job.kind]
+    entities, cursor = next_batch(model.query(), job.cursor, EXPORT_BATCH_SIZE)
+    with gcs.open(_part_path(name, model, job.part), 'w',
+                  content_type='application/x-ndjson') as part_file:
+        for entity in entities:
+            part_file.write(to_row(entity) + '\n')
+
+    job.rows += len(entities)
+    job.part += 1
+    job.cursor = cursor
+    if cursor is None:
+        job.kind += 1
+        job.part = 0
+        job.done = job.kind == len(KINDS)
+    job.put()
+    if not job.done:
+        add_named_task('export-{}-{}-{}'.format(name, job.kind, job.part),
+                       QUEUE_URL + '/export', {'name': name})
+    return len(entities)
+
+
+def start_import(name):
+    """Starts importing an export, or resumes it from its last checkpoint"""
+    job = BulkJob.get_or_insert('import-' + name)
+    if not job.done:
+        add_named_task('import-{}-{}-{}'.format(name, job.kind, job.part),
+                       QUEUE_URL + '/import', {'name': name})
+
+
+def _name_entries(users):
+    """Returns the UserName entries to add for a batch of imported users,
+    leaving out names already taken by another user"""
+    name_keys = [ndb.Key(UserName, normalize_name(user.name))
+                 for user in users]
+    taken = dict((entry.key, entry.user) for entry in
+                 ndb.get_multi(name_keys) if entry)
+    entries = []
+    for user, name_key in zip(users, name_keys):
+        owner = taken.get(name_key)
+        if owner is None:
+            taken[name_key] = user.key
+            entries.append(UserName(key=name_key, user=user.key))
+        elif owner != user.key:
+            logging.warning('Not indexing imported user %s, the name %s is '
+                            'taken by user %s', user.key.urlsafe(),
+                            user.name, owner.urlsafe())
+    return entries
+
+
+def _put_batch(model, entities):
+    if model is User:
+        entities = entities + _name_entries(entities)
+    elif model is Game:
+        # Cache the games when they are next read, not one by one now
+        for game in entities:
+            game.cache_on_put = False
+        gamecache.evict_multi([game.key for game in entities])
+    ndb.put_multi(entities)
+
+
+def import_part(name):
+    """Saves the entities of the next file of an export and queues the next
+    file. Files are read in the order they were written, so users are saved
+    before their daily scores, games and scores."""
+    job = BulkJob.get_by_id('import-' + name)
+    if job is None or job.done:
+        return
+    model = KINDS[job.kind]
+    batch = []
+    try:
+        with gcs.open(_part_path(name, model, job.part)) as part_file:
+            for line in part_file:
+                batch.append(from_row(model, line))
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    _put_batch(model, batch)
+                    job.rows += len(batch)
+                    batch = []
+        if batch:
+            _put_batch(model, batch)
+            job.rows += len(batch)
+        job.part += 1
+    except gcs.NotFoundError:
+        # Past the last file of the kind
+        job.kind += 1
+        job.part = 0
+        job.done = job.kind == len(KINDS)
+
+    job.put()
+    if not job.done:
+        add_named_task('import-{}-{}-{}'.format(name, job.kind, job.part),
+                       QUEUE_URL + '/import', {'name': name})
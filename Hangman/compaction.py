@@ -0,0 +1,92 @@
+"""compaction.py - Daily compaction of finished games and old scores.
+
+Scores older than SCORE_RETENTION_DAYS are rolled up into one DailyScore per
+user and day, and deleted, so the Score indexes only hold recent play. Users'
+totals and user_score are kept on the User and don't change. Only the Scores
+on the all time leaderboard, its top leaderboard.SIZE (100) entries, are kept
+whatever their age, so the top 100 is unchanged. Older Scores ranked below it
+are rolled up like any other: the all time board past its top 100, get_scores
+and get_user_scores only list Scores of the retention period.
+
+Games that ended more than GAME_RETENTION_DAYS ago are deleted, so queries
+on game_over, such as the reminder scan and the reconcile cron, walk an index
+that grows with active games instead of all games ever played. Their Scores
+are kept.
+
+Both run as chains of tasks, one batch per task."""
+
+import itertools
+from datetime import date, timedelta
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import leaderboard
+from models import Game, Score, DailyScore
+from utils import next_batch
+
+# Days Scores are kept for, unless they are in the all time top 100
+SCORE_RETENTION_DAYS = 35
+GAME_RETENTION_DAYS = 30
+BATCH_SIZE = 500
+# Scores saved before they were children of their User are each in their own
+# entity group, so each transaction rolls up at most this many
+ROLL_UP_SIZE = 20
+
+
+@ndb.transactional(xg=True)
+def _roll_up(user_key, score_keys):
+    """Adds the Scores of a user to their DailyScores and deletes them. The
+    Scores are read again in the transaction, so a retried batch doesn't add
+    them twice. The user is saved too, so reconcile.py checks its totals
+    again once the move has settled."""
+    user_future = user_key.get_async()
+    scores = [score for score in ndb.get_multi(score_keys) if score]
+    days = sorted(set(score.date for score in scores))
+    daily = dict((day, entity or DailyScore(
+        key=DailyScore.key_for(user_key, day), date=day))
+        for day, entity in zip(days, ndb.get_multi(
+            [DailyScore.key_for(user_key, day) for day in days])))
+    for score in scores:
+        daily[score.date].add(score)
+    user = user_future.get_result()
+    ndb.put_multi(daily.values() + ([user] if user else []))
+    ndb.delete_multi([score.key for score in scores])
+    return len(scores)
+
+
+def compact_scores(cursor=None):
+    """Rolls up a batch of Scores older than the retention period, then
+    queues the next batch. Returns the number of Scores rolled up."""
+    cutoff = date.today() - timedelta(days=SCORE_RETENTION_DAYS)
+    scores, cursor = next_batch(Score.query(Score.date < cutoff), cursor,
+                                BATCH_SIZE, projection=[Score.user])
+    # The all time board is rebuilt from Scores when it changes
+    kept = set(entry['key'] for entry in leaderboard.read(leaderboard.SCORES))
+    scores = sorted((score for score in scores
+                     if score.key.urlsafe() not in kept),
+                    key=lambda score: score.user)
+
+    rolled_up = 0
+    for user_key, user_scores in itertools.groupby(scores, lambda score:
+                                                   score.user):
+        keys = [score.key for score in user_scores]
+        for start in range(0, len(keys), ROLL_UP_SIZE):
+            rolled_up += _roll_up(user_key, keys[start:start + ROLL_UP_SIZE])
+
+    if cursor:
+        taskqueue.add(url='/tasks/compact/scores', params={'cursor': cursor})
+    return rolled_up
+
+
+def archive_games():
+    """Deletes a batch of Games that ended before the retention period, then
+    queues the next batch if there may be more. Returns the number of Games
+    deleted."""
+    cutoff = date.today() - timedelta(days=GAME_RETENTION_DAYS)
+    # Deleted games drop out of the query, so every batch is the first one
+    keys = Game.query(Game.ended < cutoff).fetch(BATCH_SIZE, keys_only=True)
+    ndb.delete_multi(keys)
+    if len(keys) == BATCH_SIZE:
+        taskqueue.add(url='/tasks/compact/games')
+    return len(keys)
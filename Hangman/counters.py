@@ -0,0 +1,96 @@
+"""counters.py - Sharded counters.
+
+Each named counter is spread over NUM_SHARDS entities, each in its own entity
+group, so concurrent updates rarely write to the same entity. The total is
+cached in memcache and kept up to date on every increment. The _async
+versions are tasklets, so several counters can be read or updated at once."""
+
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+NUM_SHARDS = 20
+MEMCACHE_NAMESPACE = 'counters'
+
+
+class CounterShard(ndb.Model):
+    """One shard of a named counter"""
+    count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+
+def _shard_keys(name):
+    return [ndb.Key(CounterShard, '{}-{}'.format(name, index))
+            for index in range(NUM_SHARDS)]
+
+
+@ndb.tasklet
+def get_stored_count_async(name):
+    """Returns a future for the total of a counter summed from its shards,
+    leaving out the cached total"""
+    shards = yield ndb.get_multi_async(_shard_keys(name))
+    raise ndb.Return(sum(shard.count for shard in shards if shard))
+
+
+def get_stored_count(name):
+    """Returns the total of a counter summed from its shards"""
+    return get_stored_count_async(name).get_result()
+
+
+@ndb.tasklet
+def get_count_async(name):
+    """Returns a future for the total of a counter"""
+    context = ndb.get_context()
+    total = yield context.memcache_get(name, namespace=MEMCACHE_NAMESPACE)
+    if total is None:
+        total = yield get_stored_count_async(name)
+        yield context.memcache_add(name, total, namespace=MEMCACHE_NAMESPACE)
+    raise ndb.Return(total)
+
+
+def get_count(name):
+    """Returns the total of a counter"""
+    return get_count_async(name).get_result()
+
+
+def uncache(name):
+    """Drops the cached total of a counter, so the next read sums the
+    shards again"""
+    memcache.delete(name, namespace=MEMCACHE_NAMESPACE)
+
+
+@ndb.transactional_tasklet(xg=True)
+def _add_to_shard(key, delta):
+    shard = (yield key.get_async()) or CounterShard(key=key)
+    shard.count += delta
+    yield shard.put_async()
+
+
+def _add_to_cache(name, delta):
+    # Cached totals can't go below zero, drop the total rather than clamp it
+    if delta > 0:
+        result = memcache.incr(name, delta, namespace=MEMCACHE_NAMESPACE)
+    else:
+        result = memcache.decr(name, -delta, namespace=MEMCACHE_NAMESPACE)
+    if result is None or (delta < 0 and result == 0):
+        memcache.delete(name, namespace=MEMCACHE_NAMESPACE)
+
+
+@ndb.tasklet
+def increment_async(name, delta=1):
+    """Adds delta, which may be negative, to a counter. When called inside a
+    transaction the shard is written as part of it, and the cached total is
+    only updated once the transaction commits."""
+    if not delta:
+        return
+    key = random.choice(_shard_keys(name))
+    yield _add_to_shard(key, delta)
+    if ndb.in_transaction():
+        ndb.get_context().call_on_commit(lambda: _add_to_cache(name, delta))
+    else:
+        _add_to_cache(name, delta)
+
+
+def increment(name, delta=1):
+    """Adds delta to a counter, see increment_async"""
+    increment_async(name, delta).get_result()
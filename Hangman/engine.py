@@ -0,0 +1,134 @@
+"""engine.py - Hangman game rules, independent of the datastore.
+
+Guessed letters are kept as a 26 bit mask and the target word is indexed as a
+map from each letter to the positions it occupies, so validating a guess is
+O(1) and revealing it is O(occurrences of the letter)."""
+
+HIDDEN = '$'
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+LETTER_BITS = dict((letter, 1 << i) for i, letter in enumerate(LETTERS))
+
+# Outcomes of a guess. Only CORRECT, WRONG, WON and LOST change the game.
+GAME_OVER = 'game_over'
+NOT_ONE_LETTER = 'not_one_letter'
+NOT_A_LETTER = 'not_a_letter'
+ALREADY_FOUND = 'already_found'
+ALREADY_TRIED = 'already_tried'
+CORRECT = 'correct'
+WRONG = 'wrong'
+WON = 'won'
+LOST = 'lost'
+
+ACCEPTED = frozenset([CORRECT, WRONG, WON, LOST])
+FOUND = frozenset([CORRECT, WON])
+
+# Wrong guesses a new game allows
+DEFAULT_ATTEMPTS = 8
+
+
+# Letter positions of recently played targets. A game's engine is rebuilt for
+# every move, so this saves indexing the same target again on each request.
+_INDEX_CACHE_SIZE = 4096
+_index_cache = {}
+
+
+def index_target(target):
+    """Returns the letter to positions map and letter mask of a target"""
+    indexed = _index_cache.get(target)
+    if indexed is None:
+        positions = {}
+        for index, letter in enumerate(target):
+            if letter in LETTER_BITS:
+                positions.setdefault(letter, []).append(index)
+        indexed = positions, mask(positions)
+        if len(_index_cache) >= _INDEX_CACHE_SIZE:
+            _index_cache.clear()
+        _index_cache[target] = indexed
+    return indexed
+
+
+def score(target, won, attempts_remaining):
+    """Returns the score of a finished game"""
+    return attempts_remaining * len(target) if won else 0
+
+
+def mask(letters):
+    """Returns the bit mask of a string of letters"""
+    bits = 0
+    for letter in letters:
+        bits |= LETTER_BITS[letter]
+    return bits
+
+
+class Engine(object):
+    """State of a single game of Hangman.
+
+    Args:
+        target: The lower case word to guess.
+        attempts_remaining: Wrong guesses left before the game is lost.
+        guesses: Letters already guessed, correct or not, in any order.
+        obscured_target: The target as revealed by guesses, if already known.
+            Saves working it out again when restoring a saved game."""
+
+    __slots__ = ('target', 'attempts_remaining', 'game_over', 'guessed',
+                 '_positions', '_target_bits', '_revealed', '_hidden')
+
+    def __init__(self, target, attempts_remaining, guesses='',
+                 obscured_target=None):
+        self.target = target
+        self.attempts_remaining = attempts_remaining
+        self.guessed = mask(guesses)
+        self._positions, self._target_bits = index_target(target)
+
+        if obscured_target is not None:
+            self._revealed = list(obscured_target)
+            self._hidden = obscured_target.count(HIDDEN)
+        elif self._target_bits & ~self.guessed:
+            # Anything that is not a letter can't be guessed, so it is shown
+            self._revealed = [HIDDEN if letter in self._positions and
+                              not LETTER_BITS[letter] & self.guessed
+                              else letter for letter in target]
+            self._hidden = self._revealed.count(HIDDEN)
+        else:
+            self._revealed = list(target)
+            self._hidden = 0
+        self.game_over = self._hidden == 0 or attempts_remaining < 1
+
+    @property
+    def obscured_target(self):
+        """The target with letters that have not been found replaced by $"""
+        return ''.join(self._revealed)
+
+    def guess(self, guess):
+        """Applies a guess and returns its outcome. Guesses that are not a
+        single letter, or letters that were already guessed, leave the game
+        untouched and cost no attempt."""
+        if self.game_over:
+            return GAME_OVER
+        if len(guess) != 1:
+            return NOT_ONE_LETTER
+        letter = guess.lower()
+        bit = LETTER_BITS.get(letter)
+        if bit is None:
+            return NOT_A_LETTER
+        letter = str(letter)
+
+        if bit & self.guessed:
+            return ALREADY_FOUND if bit & self._target_bits else ALREADY_TRIED
+        self.guessed |= bit
+
+        if bit & self._target_bits:
+            positions = self._positions[letter]
+            for index in positions:
+                self._revealed[index] = letter
+            self._hidden -= len(positions)
+            if self._hidden == 0:
+                self.game_over = True
+                return WON
+            return CORRECT
+
+        self.attempts_remaining -= 1
+        if self.attempts_remaining < 1:
+            self.game_over = True
+            return LOST
+        return WRONG
@@ -0,0 +1,105 @@
+"""gamecache.py - Memcache layer for Game entities.
+
+Players read the same Game over and over between moves, so games are cached
+in memcache, written through whenever a game is saved and evicted when it is
+deleted. Each cached copy carries the game's version, and a copy is only
+replaced by a newer version (using compare-and-set), so a slow writer can't
+put an older state of the game back into the cache. Copies expire after
+CACHE_SECONDS, which bounds how long a copy stored by a slow read after the
+game was deleted can outlive it. Within a request, ndb's context cache still
+serves repeated gets of the same key.
+
+Hits and misses are counted per instance and added to shared memcache
+counters every STATS_FLUSH_EVERY lookups."""
+
+import threading
+
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import ndb
+
+MEMCACHE_NAMESPACE = 'games'
+STATS_NAMESPACE = 'game_cache_stats'
+STATS_FLUSH_EVERY = 100
+CAS_RETRIES = 3
+CACHE_SECONDS = 3600
+
+_adapter = ndb.ModelAdapter()
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache_key(key):
+    return key.urlsafe()
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+        if _stats['hits'] + _stats['misses'] < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_stats)
+        _stats['hits'] = _stats['misses'] = 0
+    memcache.offset_multi(pending, namespace=STATS_NAMESPACE,
+                          initial_value=0)
+
+
+def stats():
+    """Returns the hit and miss counts of all instances, as flushed so far"""
+    counts = memcache.get_multi(['hits', 'misses'],
+                                namespace=STATS_NAMESPACE)
+    return counts.get('hits', 0), counts.get('misses', 0)
+
+
+def get(key):
+    """Returns the Game of a key, from memcache when it is cached there, or
+    None if there is no such game"""
+    cached = memcache.get(_cache_key(key), namespace=MEMCACHE_NAMESPACE)
+    if cached is not None:
+        _count('hits')
+        return _adapter.pb_to_entity(entity_pb.EntityProto(cached[1]))
+    _count('misses')
+    game = key.get()
+    if game is not None:
+        store(game)
+    return game
+
+
+def store(game):
+    """Caches a game unless a copy of the same or a newer version is already
+    cached"""
+    client = memcache.Client()
+    cache_key = _cache_key(game.key)
+    value = (game.version, _adapter.entity_to_pb(game).Encode())
+    for _ in range(CAS_RETRIES):
+        cached = client.gets(cache_key, namespace=MEMCACHE_NAMESPACE)
+        if cached is None:
+            if client.add(cache_key, value, time=CACHE_SECONDS,
+                          namespace=MEMCACHE_NAMESPACE):
+                return
+        elif cached[0] >= game.version:
+            return
+        elif client.cas(cache_key, value, time=CACHE_SECONDS,
+                        namespace=MEMCACHE_NAMESPACE):
+            return
+    # Lost every race, let the next read load the game again
+    evict(game.key)
+
+
+def evict(key):
+    memcache.delete(_cache_key(key), namespace=MEMCACHE_NAMESPACE)
+
+
+def evict_multi(keys):
+    memcache.delete_multi([_cache_key(key) for key in keys],
+                          namespace=MEMCACHE_NAMESPACE)
+
+
+def on_commit(callback, *args):
+    """Calls callback once the current transaction commits, or right away
+    outside of transactions. Used by the Game hooks, so the cache never holds
+    a state that was rolled back."""
+    if ndb.in_transaction():
+        ndb.get_context().call_on_commit(lambda: callback(*args))
+    else:
+        callback(*args)
@@ -0,0 +1,107 @@
+"""instrumentation.py - Per-endpoint request instrumentation.
+
+Endpoint methods decorated with @instrumented record, for a sample of
+requests, the wall time, the App Engine RPCs made by service and call, the
+datastore entities read and written and the memcache hits and misses. RPCs
+are counted by apiproxy hooks, so they include those made by ndb.
+
+Each sampled request is logged as one JSON line and added to per-instance
+totals, served by the get_endpoint_stats endpoint. The share of requests
+sampled is set with the INSTRUMENTATION_SAMPLE_RATE environment variable in
+app.yaml; requests that are not sampled only pay for one random number."""
+
+import copy
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+
+SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+
+_local = threading.local()
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def _add(counts, name, value=1):
+    counts[name] = counts.get(name, 0) + value
+
+
+def _post_call_hook(service, call, request, response, rpc=None, error=None):
+    """Counts an RPC, and what it read or wrote, for the sampled request"""
+    counts = getattr(_local, 'counts', None)
+    if counts is None:
+        return
+    _add(counts, 'rpc.{}.{}'.format(service, call))
+    if error is not None:
+        _add(counts, 'rpc_errors')
+        return
+    if service == 'datastore_v3':
+        if call == 'Get':
+            _add(counts, 'entities.read',
+                 sum(1 for entity in response.entity_list()
+                     if entity.has_entity()))
+        elif call in ('RunQuery', 'Next'):
+            _add(counts, 'entities.read', response.result_size())
+        elif call == 'Put':
+            _add(counts, 'entities.written', request.entity_size())
+        elif call == 'Delete':
+            _add(counts, 'entities.written', request.key_size())
+    elif service == 'memcache' and call == 'Get':
+        hits = response.item_size()
+        _add(counts, 'memcache.hits', hits)
+        _add(counts, 'memcache.misses', request.key_size() - hits)
+
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+    'instrumentation', _post_call_hook)
+
+
+def _record(endpoint, elapsed, counts):
+    logging.info(json.dumps({'endpoint': endpoint,
+                             'ms': round(elapsed * 1000, 2),
+                             'counts': counts}, sort_keys=True))
+    with _totals_lock:
+        totals = _totals.setdefault(endpoint, {'calls': 0, 'total_ms': 0.0,
+                                               'max_ms': 0.0, 'counts': {}})
+        totals['calls'] += 1
+        totals['total_ms'] += elapsed * 1000
+        totals['max_ms'] = max(totals['max_ms'], elapsed * 1000)
+        for name, value in counts.items():
+            _add(totals['counts'], name, value)
+
+
+def instrumented(method):
+    """Decorator for endpoint methods recording a sample of their calls"""
+    @functools.wraps(method)
+    def wrapper(service, request):
+        if getattr(_local, 'counts', None) is not None or \
+                random.random() >= SAMPLE_RATE:
+            return method(service, request)
+        _local.counts = {}
+        start = time.time()
+        try:
+            return method(service, request)
+        finally:
+            elapsed = time.time() - start
+            counts, _local.counts = _local.counts, None
+            _record(method.__name__, elapsed, counts)
+    return wrapper
+
+
+def stats(reset=False):
+    """Returns the totals of the requests sampled on this instance, by
+    endpoint, and clears them if reset is True"""
+    global _totals
+    with _totals_lock:
+        totals = _totals
+        if reset:
+            _totals = {}
+        else:
+            totals = copy.deepcopy(totals)
+    return totals
@@ -0,0 +1,221 @@
+"""leaderboard.py - Precomputed leaderboards.
+
+Each board keeps its top SIZE entries in a LeaderboardSnapshot entity and in
+memcache, so reading a board is usually a single cache hit. Boards are
+updated incrementally from a task queued when a game ends, instead of being
+queried on every read.
+
+Boards:
+    scores: Highest game scores of all time.
+    scores:day:YYYY-MM-DD: Highest game scores of a day.
+    scores:week:YYYY-Www: Highest game scores of an ISO week.
+    users: Users ranked by user_score.
+
+The all time boards are backed by a query, so pages past the top SIZE
+entries are read from the datastore. Day and week boards stop at SIZE, and
+are built from Scores, so they can only be built for dates whose Scores
+compaction.py has not rolled up yet."""
+
+from datetime import date, datetime, timedelta
+
+from google.appengine.api import memcache
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb
+
+from models import User, Score
+from utils import next_batch
+
+SIZE = 100
+MEMCACHE_NAMESPACE = 'leaderboard'
+
+SCORES = 'scores'
+USERS = 'users'
+
+# Cursors into a board are the position on the board prefixed with 'b',
+# past the end of a board they are query cursors prefixed with 'q'
+BOARD_CURSOR = 'b'
+QUERY_CURSOR = 'q'
+
+
+class LeaderboardSnapshot(ndb.Model):
+    """Top entries of a board, keyed by board name"""
+    entries = ndb.JsonProperty(required=True, compressed=True)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+def day_board(day):
+    """Returns the name of the board of a date"""
+    return 'scores:day:{}'.format(day.isoformat())
+
+
+def week_board(day):
+    """Returns the name of the board of the ISO week of a date"""
+    year, week, _ = day.isocalendar()
+    return 'scores:week:{}-W{:02d}'.format(year, week)
+
+
+def score_entry(score):
+    return {'key': score.key.urlsafe(), 'user_name': score.get_user_name(),
+            'date': str(score.date), 'won': score.won,
+            'game_score': score.game_score}
+
+
+def user_entry(user):
+    return {'key': user.key.urlsafe(), 'user_name': user.name,
+            'user_score': user.user_score}
+
+
+def _ranked_by(name):
+    return 'user_score' if name == USERS else 'game_score'
+
+
+def _query(name):
+    """Returns the query ranking a board, or None for boards without one"""
+    if name == SCORES:
+        return Score.query().order(-Score.game_score)
+    if name == USERS:
+        # Entries only need the name and score, read them from the index
+        return User.query(projection=[User.name, User.user_score]).order(
+            -User.user_score)
+    if name.startswith('scores:day:'):
+        day = datetime.strptime(name.rsplit(':', 1)[1], '%Y-%m-%d').date()
+        return Score.query(Score.date == day).order(-Score.game_score)
+    return None
+
+
+def _to_entry(name, entity):
+    return user_entry(entity) if name == USERS else score_entry(entity)
+
+
+def _build(name):
+    """Computes the entries of a board from the datastore"""
+    query = _query(name)
+    if query is not None:
+        return [_to_entry(name, entity) for entity in query.fetch(SIZE)]
+
+    # A week's top scores are all in the top scores of its days, which are
+    # queried together without saving boards for them
+    year, week = name.rsplit(':', 1)[1].split('-W')
+    # ISO week 1 is the week holding January 4th
+    january_4th = date(int(year), 1, 4)
+    monday = (january_4th - timedelta(days=january_4th.weekday()) +
+              timedelta(weeks=int(week) - 1))
+    futures = [_query(day_board(monday + timedelta(days=offset))).fetch_async(
+        SIZE) for offset in range(7)]
+    entries = [score_entry(score) for future in futures
+               for score in future.get_result()]
+    entries.sort(key=lambda entry: entry['game_score'], reverse=True)
+    return entries[:SIZE]
+
+
+@ndb.transactional
+def _create(name, entries):
+    """Saves the snapshot of a board unless one was saved since it was
+    built, so a board updated meanwhile is not overwritten. Returns the
+    entries of the saved snapshot."""
+    snapshot = LeaderboardSnapshot.get_by_id(name)
+    if snapshot is None:
+        snapshot = LeaderboardSnapshot(id=name, entries=entries)
+        snapshot.put()
+    return snapshot.entries
+
+
+def read(name):
+    """Returns the top entries of a board, best first"""
+    entries = memcache.get(name, namespace=MEMCACHE_NAMESPACE)
+    if entries is None:
+        snapshot = LeaderboardSnapshot.get_by_id(name)
+        if snapshot is None:
+            # Queries can't run in a transaction, the board is built first
+            entries = _create(name, _build(name))
+        else:
+            entries = snapshot.entries
+        memcache.set(name, entries, namespace=MEMCACHE_NAMESPACE)
+    return entries
+
+
+def page(name, page_size=SIZE, cursor=None):
+    """Returns a page of entries of a board and the cursor of the next page,
+    or None if there are no more entries. Raises ValueError for cursors that
+    did not come from this board."""
+    query = _query(name) if name in (SCORES, USERS) else None
+    if cursor and cursor.startswith(QUERY_CURSOR) and query is not None:
+        try:
+            entities, next_cursor = next_batch(query, cursor[1:], page_size)
+        except datastore_errors.BadValueError:
+            raise ValueError('Invalid cursor')
+        return ([_to_entry(name, entity) for entity in entities],
+                next_cursor and QUERY_CURSOR + next_cursor)
+    if cursor and not (cursor.startswith(BOARD_CURSOR) and
+                       cursor[1:].isdigit()):
+        raise ValueError('Invalid cursor')
+
+    entries = read(name)
+    offset = int(cursor[1:]) if cursor else 0
+    results = entries[offset:offset + page_size]
+    offset += len(results)
+    # A full board of an all time ranking may have more entries past it
+    more = offset < len(entries) or (query is not None and
+                                     len(entries) >= SIZE)
+    if not more:
+        return results, None
+    if len(results) == page_size:
+        return results, '{}{}'.format(BOARD_CURSOR, offset)
+
+    entities, next_cursor = next_batch(query, None, page_size - len(results),
+                                       offset=offset)
+    results.extend(_to_entry(name, entity) for entity in entities)
+    return results, next_cursor and QUERY_CURSOR + next_cursor
+
+
+@ndb.transactional
+def _update(name, entry):
+    """Puts entry, replacing any entry with the same key, at its rank on a
+    board. Returns the new entries, or None if the board must be rebuilt."""
+    snapshot = LeaderboardSnapshot.get_by_id(name)
+    if snapshot is None:
+        return None
+    field = _ranked_by(name)
+    entries = [old for old in snapshot.entries if old['key'] != entry['key']]
+    was_full = len(snapshot.entries) >= SIZE
+
+    rank = len(entries)
+    while rank > 0 and entries[rank - 1][field] < entry[field]:
+        rank -= 1
+    if rank < SIZE:
+        entries.insert(rank, entry)
+        del entries[SIZE:]
+    elif len(entries) == len(snapshot.entries):
+        # Not on the board before or after, nothing to save
+        return entries
+    if was_full and len(entries) < SIZE and _query(name) is not None:
+        # An entry dropped off a full board, the next best is unknown
+        snapshot.key.delete()
+        return None
+
+    snapshot.entries = entries
+    snapshot.put()
+    return entries
+
+
+def _record(name, entry):
+    read(name)
+    entries = _update(name, entry)
+    if entries is None:
+        memcache.delete(name, namespace=MEMCACHE_NAMESPACE)
+    else:
+        memcache.set(name, entries, namespace=MEMCACHE_NAMESPACE)
+
+
+def record_score(score):
+    """Adds a new Score to the all time, day and week boards"""
+    entry = score_entry(score)
+    for name in (SCORES, day_board(score.date), week_board(score.date)):
+        _record(name, entry)
+
+
+def record_user(user):
+    """Moves a User to its new rank on the user rankings. Users that no
+    longer exist are skipped."""
+    if user is not None:
+        _record(USERS, user_entry(user))
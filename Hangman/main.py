@@ -5,50 +5,227 @@ cronjobs."""
 import logging
 
 import webapp2
-from google.appengine.api import mail, app_identity
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 from api import HangmanApi
-from models import Game, User
-
-from models import User
+import bulk
+import compaction
+import instrumentation
+import leaderboard
+import migrations
+import reconcile
+import reminders
 
 
 class SendReminderEmail(webapp2.RequestHandler):
     def get(self):
         """Send a reminder email to users with active games.
         Called every 24 hours using a cron job"""
-        app_id = "my-hangman-game"
-        # Get active games
-        active_games = Game.query(Game.game_over != True)
-        users = []
-        # Use the active games to get user keys to get the users
-        for game in active_games:
-            user = User.query(User.key == game.user).get()
-            # If the user has an email, add the user object to users list
-            if user not in users and user.email:
-                users.append(user)
-        if len(users) != 0:
-            for user in users:
-                subject = 'This is a reminder!'
-                body = 'Hello {}, come back and finish playing ' \
-                       'Hangman!'.format(user.name)
-                print body
-                # This will send test emails, the arguments to send_mail are:
-                # from, to, subject, body
-                mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
-                               user.email,
-                               subject,
-                               body)
+        reminders.start()
+
+
+class ScanReminders(webapp2.RequestHandler):
+    def post(self):
+        """Find the users of the next batch of active games."""
+        reminders.scan(self.request.get('run'),
+                       int(self.request.get('attempt') or 0))
+        self.response.set_status(204)
+
+
+class SendReminders(webapp2.RequestHandler):
+    def post(self):
+        """Email a batch of users."""
+        reminders.send(self.request.get('users'))
+        self.response.set_status(204)
+
+
+class ReconcileAverageMovesRemaining(webapp2.RequestHandler):
+    def get(self):
+        """Start recounting the running totals of active games.
+        Called every hour using a cron job"""
+        reconcile.start_games()
 
 
 class UpdateAverageMovesRemaining(webapp2.RequestHandler):
     def post(self):
-        """Update game listing announcement in memcache."""
-        HangmanApi._cache_average_attempts()
+        """Recount one batch of active games, queueing the next one. Only
+        runs as a task."""
+        if 'X-AppEngine-QueueName' not in self.request.headers:
+            self.abort(403)
+        reconcile.recount_games_batch(int(self.request.get('batch') or 0))
+        self.response.set_status(204)
+
+
+class ReconcileUsers(webapp2.RequestHandler):
+    def get(self):
+        """Start checking the totals of the users saved since the last run.
+        Called every hour using a cron job"""
+        reconcile.start()
+
+
+class CheckUsers(webapp2.RequestHandler):
+    def get(self):
+        """Start checking the totals of every user, or resume the current
+        run. Visit as an admin to run it."""
+        reconcile.start(full=True)
+        self.response.write('User reconciliation started.')
+
+    def post(self):
+        """Check one batch of users, queueing the next one."""
+        reconcile.reconcile_batch()
+        self.response.set_status(204)
+
+
+class UpdateLeaderboards(webapp2.RequestHandler):
+    def post(self):
+        """Add a new Score and its user's new user_score to the
+        leaderboards. Queued when a game ends."""
+        score = ndb.Key(urlsafe=self.request.get('score')).get()
+        if score:
+            leaderboard.record_score(score)
+            leaderboard.record_user(score.user.get())
         self.response.set_status(204)
 
 
+class MigrateUserNames(webapp2.RequestHandler):
+    def get(self):
+        """Start copying user names onto Games and Scores saved without
+        one. Visit as an admin to run the migration."""
+        for kind in ('Game', 'Score'):
+            taskqueue.add(url='/tasks/migrate_user_names',
+                          params={'kind': kind})
+        self.response.write('User name migration started.')
+
+    def post(self):
+        """Migrate one batch, queueing the next one."""
+        updated = migrations.denormalize_user_names(
+            self.request.get('kind'), self.request.get('cursor') or None)
+        logging.info('Set user_name on %d %s entities', updated,
+                     self.request.get('kind'))
+        self.response.set_status(204)
+
+
+class MigrateMoveLogs(webapp2.RequestHandler):
+    def get(self):
+        """Start converting the history of Games saved before they had a
+        move log. Visit as an admin to run the migration."""
+        taskqueue.add(url='/tasks/migrate_move_logs')
+        self.response.write('Move log migration started.')
+
+    def post(self):
+        """Migrate one batch, queueing the next one."""
+        converted = migrations.convert_move_logs(
+            self.request.get('cursor') or None)
+        logging.info('Converted the history of %d games', converted)
+        self.response.set_status(204)
+
+
+class IndexUserNames(webapp2.RequestHandler):
+    def get(self):
+        """Start adding Users created before the UserName index to it.
+        Visit as an admin to run the migration."""
+        taskqueue.add(url='/tasks/index_user_names')
+        self.response.write('User name index migration started.')
+
+    def post(self):
+        """Migrate one batch, queueing the next one."""
+        conflicts = migrations.index_user_names(
+            self.request.get('cursor') or None)
+        if conflicts:
+            logging.warning('%d users have a name already taken', conflicts)
+        self.response.set_status(204)
+
+
+class ExportData(webapp2.RequestHandler):
+    def get(self):
+        """Start, or resume, the export named by the name parameter. Visit
+        as an admin to run it."""
+        bulk.start_export(self.request.get('name'))
+        self.response.write('Export started.')
+
+    def post(self):
+        """Export one batch, queueing the next one."""
+        bulk.export_batch(self.request.get('name'))
+        self.response.set_status(204)
+
+
+class ImportData(webapp2.RequestHandler):
+    def get(self):
+        """Start, or resume, importing the export named by the name
+        parameter. Visit as an admin to run it."""
+        bulk.start_import(self.request.get('name'))
+        self.response.write('Import started.')
+
+    def post(self):
+        """Import one file, queueing the next one."""
+        bulk.import_part(self.request.get('name'))
+        self.response.set_status(204)
+
+
+class Compact(webapp2.RequestHandler):
+    def get(self):
+        """Start rolling up old scores and archiving finished games.
+        Called every day using a cron job"""
+        taskqueue.add(url='/tasks/compact/scores')
+        taskqueue.add(url='/tasks/compact/games')
+
+
+class CompactScores(webapp2.RequestHandler):
+    def post(self):
+        """Roll up one batch of old scores, queueing the next one."""
+        rolled_up = compaction.compact_scores(
+            self.request.get('cursor') or None)
+        logging.info('Rolled up %d scores', rolled_up)
+        self.response.set_status(204)
+
+
+class ArchiveGames(webapp2.RequestHandler):
+    def post(self):
+        """Delete one batch of finished games, queueing the next one."""
+        logging.info('Archived %d games', compaction.archive_games())
+        self.response.set_status(204)
+
+
+class StampFinishedGames(webapp2.RequestHandler):
+    def get(self):
+        """Start setting the ended date of finished Games saved without one.
+        Visit as an admin to run the migration."""
+        taskqueue.add(url='/tasks/stamp_finished_games')
+        self.response.write('Finished game migration started.')
+
+    def post(self):
+        """Migrate one batch, queueing the next one."""
+        stamped = migrations.stamp_finished_games(
+            self.request.get('cursor') or None)
+        logging.info('Set the ended date of %d games', stamped)
+        self.response.set_status(204)
+
+
+class ResetEndpointStats(webapp2.RequestHandler):
+    def get(self):
+        """Clear the endpoint stats sampled on the instance serving this
+        request. Visit as an admin to reset them."""
+        instrumentation.stats(reset=True)
+        self.response.write('Endpoint stats reset.')
+
+
 app = webapp2.WSGIApplication([
     ('/crons/send_reminder', SendReminderEmail),
+    ('/tasks/reminders/scan', ScanReminders),
+    ('/tasks/reminders/send', SendReminders),
+    ('/crons/reconcile_average_attempts', ReconcileAverageMovesRemaining),
     ('/tasks/cache_average_attempts', UpdateAverageMovesRemaining),
+    ('/crons/reconcile_users', ReconcileUsers),
+    ('/tasks/reconcile/users', CheckUsers),
+    ('/tasks/update_leaderboards', UpdateLeaderboards),
+    ('/tasks/migrate_user_names', MigrateUserNames),
+    ('/tasks/migrate_move_logs', MigrateMoveLogs),
+    ('/tasks/index_user_names', IndexUserNames),
+    ('/tasks/bulk/export', ExportData),
+    ('/tasks/bulk/import', ImportData),
+    ('/crons/compact', Compact),
+    ('/tasks/compact/scores', CompactScores),
+    ('/tasks/compact/games', ArchiveGames),
+    ('/tasks/stamp_finished_games', StampFinishedGames),
+    ('/tasks/reset_endpoint_stats', ResetEndpointStats),
 ], debug=True)
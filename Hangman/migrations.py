@@ -0,0 +1,106 @@
+"""migrations.py - Batched data migrations. Each call migrates one batch of
+entities and queues a task for the next one, so a migration never runs into
+request deadlines however many entities there are."""
+
+import logging
+from datetime import date
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import User, Game, Score, UserNameIndexComplete, \
+    index_user_name
+from utils import next_batch
+
+BATCH_SIZE = 100
+
+
+@ndb.transactional
+def _set_user_name(key, user_name):
+    """Sets user_name without overwriting changes saved since the batch was
+    read, e.g. a move made on a game"""
+    entity = key.get()
+    if entity and entity.user_name is None:
+        entity.user_name = user_name
+        entity.put()
+
+
+def denormalize_user_names(kind, cursor=None):
+    """Copies the user's name onto a batch of Game or Score entities saved
+    before they had a user_name, then queues the next batch.
+    Returns the number of entities updated."""
+    model = {'Game': Game, 'Score': Score}[kind]
+    entities, cursor = next_batch(model.query(), cursor, BATCH_SIZE)
+
+    missing = [entity for entity in entities if entity.user_name is None]
+    users = ndb.get_multi(list(set(entity.user for entity in missing)))
+    names = dict((user.key, user.name) for user in users if user)
+    for entity in missing:
+        if entity.user in names:
+            _set_user_name(entity.key, names[entity.user])
+
+    if cursor:
+        taskqueue.add(url='/tasks/migrate_user_names',
+                      params={'kind': kind, 'cursor': cursor})
+    return len(missing)
+
+
+@ndb.transactional
+def _convert_move_log(key):
+    game = key.get()
+    if game and game.upgrade_history():
+        game.put()
+
+
+def convert_move_logs(cursor=None):
+    """Converts the history strings of a batch of Games saved before they had
+    a move log, then queues the next batch. Returns the number of games
+    converted."""
+    games, cursor = next_batch(Game.query(), cursor, BATCH_SIZE)
+
+    legacy = [game.key for game in games if game.all_guesses is not None]
+    for key in legacy:
+        _convert_move_log(key)
+
+    if cursor:
+        taskqueue.add(url='/tasks/migrate_move_logs', params={'cursor': cursor})
+    return len(legacy)
+
+
+def index_user_names(cursor=None):
+    """Adds a batch of Users created before the UserName index to it, then
+    queues the next batch, or marks the index as complete after the last
+    batch. Returns the number of users whose name was taken by another user,
+    ignoring case; they can't be looked up by name."""
+    users, cursor = next_batch(User.query(), cursor, BATCH_SIZE)
+
+    conflicts = 0
+    for user in users:
+        if index_user_name(user) != user.key:
+            logging.warning('User %s has the same name as another user',
+                            user.key.urlsafe())
+            conflicts += 1
+
+    if cursor:
+        taskqueue.add(url='/tasks/index_user_names', params={'cursor': cursor})
+    else:
+        UserNameIndexComplete(id='users').put()
+    return conflicts
+
+
+def stamp_finished_games(cursor=None):
+    """Sets today as the day a batch of finished Games ended when they were
+    saved before Games had an ended date, so compaction archives them once
+    the retention period is over. Then queues the next batch.
+    Returns the number of games stamped."""
+    games, cursor = next_batch(Game.query(Game.game_over == True), cursor,
+                               BATCH_SIZE)
+    unstamped = [game for game in games if game.ended is None]
+    for game in unstamped:
+        game.ended = date.today()
+    ndb.put_multi(unstamped)
+
+    if cursor:
+        taskqueue.add(url='/tasks/stamp_finished_games',
+                      params={'cursor': cursor})
+    return len(unstamped)
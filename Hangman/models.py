@@ -2,12 +2,182 @@
 entities used by the Game. Because these classes are also regular Python
 classes they can include methods (such as 'to_form' and 'new_game')."""
 
-import random
 from datetime import date
 from protorpc import messages
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
-WORDS = open('words.txt').read().splitlines()
+import counters
+import engine
+import gamecache
+import movelog
+import words
+
+# Sharded counters holding the running totals of games that are not over
+ACTIVE_GAMES_COUNTER = 'active_games'
+ACTIVE_ATTEMPTS_COUNTER = 'active_attempts_remaining'
+# Active games a user can have at once, keeping each user's ActiveGames
+# summary, read and rewritten by every move, small
+MAX_ACTIVE_GAMES = 100
+
+
+class TooManyGamesError(Exception):
+    """Raised when new games would take a user past MAX_ACTIVE_GAMES"""
+
+
+@ndb.tasklet
+def track_active_games_async(games, attempts):
+    """Adds to the running totals of active games and of their attempts
+    remaining, updating both counters at once. Call inside the transaction
+    saving the games."""
+    yield (counters.increment_async(ACTIVE_GAMES_COUNTER, games),
+           counters.increment_async(ACTIVE_ATTEMPTS_COUNTER, attempts))
+
+
+# The datastore work of saving, deleting and ending games is done by
+# tasklets yielding independent RPCs together, so ndb sends them in parallel
+# and batches those of the same kind into a single call.
+
+@ndb.tasklet
+def _update_active_games_async(game, removed=False):
+    """Updates the game in the summary of its user's active games. Call
+    inside the transaction saving the game."""
+    summary = yield ActiveGames.get_for_async(game.user)
+    summary.update(game, removed)
+    yield summary.put_async()
+
+
+@ndb.transactional_tasklet(xg=True)
+def _save_tracked(game, games, attempts):
+    if game.key.id() is None:
+        summary = yield ActiveGames.get_for_async(game.user)
+        summary.check_room(1)
+        # The summary of active games needs the key of a new game
+        yield game.put_async()
+        summary.update(game)
+        yield summary.put_async(), track_active_games_async(games, attempts)
+    else:
+        yield (game.put_async(), _update_active_games_async(game),
+               track_active_games_async(games, attempts))
+
+
+@ndb.tasklet
+def _create_games(user, targets):
+    """Creates a game of a user for each target"""
+    start, _ = yield Game.allocate_ids_async(len(targets), parent=user.key)
+    games = [Game(id=start + i, parent=user.key, user=user.key,
+                  user_name=user.name, target=target,
+                  obscured_target=engine.HIDDEN * len(target), game_over=False)
+             for i, target in enumerate(targets)]
+    for game in games:
+        # Cache the games when they are first read, not one by one now
+        game.cache_on_put = False
+    yield _save_new_games(user.key, games)
+    raise ndb.Return(games)
+
+
+@ndb.transactional_tasklet(xg=True)
+def _save_new_games(user_key, games):
+    """Saves new games of a user with the summary of the user's active
+    games, and adds them to the running totals"""
+    summary = yield ActiveGames.get_for_async(user_key)
+    summary.check_room(len(games))
+    for game in games:
+        summary.update(game)
+    yield (ndb.put_multi_async(games + [summary]),
+           track_active_games_async(
+               len(games), sum(game.attempts_remaining for game in games)))
+
+
+@ndb.transactional_tasklet(xg=True)
+def _delete_tracked(game, games, attempts):
+    yield (game.key.delete_async(),
+           _update_active_games_async(game, removed=True),
+           track_active_games_async(games, attempts))
+
+
+@ndb.transactional_tasklet(xg=True)
+def _end_game(game, won, game_score, attempts):
+    # Add game score and game to user properties. The user is read inside
+    # the transaction so concurrent updates to it are retried, not lost.
+    # The counter shards are read at the same time.
+    user_future = game.user.get_async()
+    tracked = track_active_games_async(-1, attempts)
+    summarized = _update_active_games_async(game)
+    user = yield user_future
+    user.add_game_score(game_score)
+
+    # Add the game to the score 'board'. Scores are in the user's entity
+    # group, like games, so the entities commit as one group.
+    score = Score(parent=game.user, user=game.user, user_name=user.name,
+                  date=date.today(), won=won, game_score=game_score)
+    yield ndb.put_multi_async([game, user, score]), tracked, summarized
+    # Leaderboards are updated out of the transaction, but only once it has
+    # committed
+    yield taskqueue.Task(url='/tasks/update_leaderboards',
+                         params={'score': score.key.urlsafe()}).add_async(
+                             transactional=True)
+    raise ndb.Return(score)
+
+
+def user_score(total_game_score, total_games_played):
+    """Returns the ranking score of a user with these totals"""
+    if not total_games_played:
+        return 0
+    return total_game_score/total_games_played
+
+
+class UserNameMixin(object):
+    """For entities with a user key and a denormalized user_name"""
+
+    def get_user_name(self):
+        """Returns the user's name. Only entities saved before user_name was
+        added (and not migrated yet) need to fetch the User."""
+        if self.user_name is None:
+            self.user_name = self.user.get().name
+        return self.user_name
+
+
+def normalize_name(name):
+    """Returns the form of a user name that must be unique"""
+    return name.lower()
+
+
+class UserName(ndb.Model):
+    """Index of user names, keyed by normalized name. Makes names unique and
+    lets users be looked up by name with single key gets, which ndb caches."""
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+
+
+class UserNameIndexComplete(ndb.Model):
+    """Saved by migrations.index_user_names once every User created before
+    the UserName index is in it. From then on names missing from the index
+    are of no user, and are no longer looked up with a query."""
+
+
+_user_names_indexed = False
+
+
+def user_names_indexed():
+    """Returns True once the UserName index holds every user"""
+    global _user_names_indexed
+    if not _user_names_indexed:
+        _user_names_indexed = UserNameIndexComplete.get_by_id('users') \
+            is not None
+    return _user_names_indexed
+
+
+@ndb.transactional
+def index_user_name(user):
+    """Adds a user saved before the UserName index to it, unless another
+    user already has the name. Returns the key of the user with the name."""
+    name_key = ndb.Key(UserName, normalize_name(user.name))
+    entry = name_key.get()
+    if entry is None:
+        entry = UserName(key=name_key, user=user.key)
+        entry.put()
+    return entry.user
+
 
 class User(ndb.Model):
     """User profile"""
@@ -16,6 +186,76 @@ class User(ndb.Model):
     total_game_score = ndb.IntegerProperty(required=True, default=0)
     total_games_played = ndb.IntegerProperty(required=True, default=0)
     user_score = ndb.FloatProperty(required=True, default=0)
+    # Time of the last save, e.g. the end of a game. reconcile.py only checks
+    # the totals of users saved since its last run.
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def get_by_names(cls, names):
+        """Returns the Users with each of a list of names, or None for names
+        of no user, getting all the users at once"""
+        entries = ndb.get_multi([ndb.Key(UserName, normalize_name(name))
+                                 for name in names])
+        found = iter(ndb.get_multi([entry.user for entry in entries
+                                    if entry]))
+        users = [next(found) if entry else None for entry in entries]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing and not user_names_indexed():
+            unindexed = cls._get_unindexed([names[i] for i in missing])
+            for i, user in zip(missing, unindexed):
+                users[i] = user
+        return users
+
+    @classmethod
+    def get_by_name(cls, name):
+        """Returns the User with a name, ignoring case, or None if there is
+        no such user"""
+        entry = UserName.get_by_id(normalize_name(name))
+        if entry is not None:
+            return entry.user.get()
+        if user_names_indexed():
+            return None
+        return cls._get_unindexed([name])[0]
+
+    @classmethod
+    def _get_unindexed(cls, names):
+        """Returns the Users created before the UserName index with each of a
+        list of names, or None, querying all the names at once. Users found
+        are indexed, if migrations.index_user_names did not get to them
+        yet."""
+        futures = [cls.query(cls.name == name).get_async() for name in names]
+        users = []
+        for future in futures:
+            user = future.get_result()
+            if user is not None and index_user_name(user) != user.key:
+                user = None
+            users.append(user)
+        return users
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def create(cls, name, email=None):
+        """Creates a User, reserving its name in the same transaction so two
+        users can't get the same name. Returns the User, or None if the name
+        is taken."""
+        name_key = ndb.Key(UserName, normalize_name(name))
+        if name_key.get() is not None:
+            return None
+        user = cls(name=name, email=email)
+        user.put()
+        UserName(key=name_key, user=user.key).put()
+        return user
+
+    def add_game_score(self, game_score):
+        """Adds a finished game's score to the user's totals"""
+        self.set_totals(self.total_game_score + game_score,
+                        self.total_games_played + 1)
+
+    def set_totals(self, total_game_score, total_games_played):
+        """Sets the user's totals and the user_score worked out from them"""
+        self.total_game_score = total_game_score
+        self.total_games_played = total_games_played
+        self.user_score = user_score(total_game_score, total_games_played)
 
     def to_user_ranking_form(self):
         """Returns user info to ranking form"""
@@ -24,115 +264,359 @@ class User(ndb.Model):
                                user_score=self.user_score)
 
 
-class Game(ndb.Model):
+class ActiveGame(ndb.Model):
+    """Summary of an active game, kept in ActiveGames"""
+    game = ndb.KeyProperty(required=True, kind='Game')
+    attempts_remaining = ndb.IntegerProperty(required=True)
+    obscured_target = ndb.StringProperty(required=True)
+
+    def to_form(self, user_name):
+        """Returns a GameForm representation of the active game"""
+        return GameForm(urlsafe_key=self.game.urlsafe(),
+                        attempts_remaining=self.attempts_remaining,
+                        game_over=False, message='Game in Progress',
+                        user_name=user_name,
+                        obscured_target=self.obscured_target)
+
+
+class ActiveGames(ndb.Model):
+    """Summary of the active games of a User, oldest first. A child of the
+    user, like its games, so it is updated in the transactions saving them
+    and listing the games is a single get. New games are refused once it
+    holds MAX_ACTIVE_GAMES games, so the entity stays small."""
+    games = ndb.LocalStructuredProperty(ActiveGame, repeated=True)
+
+    @classmethod
+    def key_for(cls, user_key):
+        return ndb.Key(cls, 1, parent=user_key)
+
+    @classmethod
+    @ndb.tasklet
+    def get_for_async(cls, user_key):
+        """Returns a future for the summary of a user's active games. Users
+        without one yet get a summary built from an ancestor query of their
+        games, which is strongly consistent and also works in transactions.
+        It is saved by the next update."""
+        summary = yield cls.key_for(user_key).get_async()
+        if summary is None:
+            games = yield Game.query(Game.game_over == False,
+                                     ancestor=user_key).fetch_async()
+            summary = cls(key=cls.key_for(user_key),
+                          games=[ActiveGame(game=game.key,
+                                            attempts_remaining=
+                                            game.attempts_remaining,
+                                            obscured_target=
+                                            game.obscured_target)
+                                 for game in games])
+        raise ndb.Return(summary)
+
+    def check_room(self, new_games):
+        """Raises TooManyGamesError if new_games more games would take the
+        user past MAX_ACTIVE_GAMES"""
+        if len(self.games) + new_games > MAX_ACTIVE_GAMES:
+            raise TooManyGamesError(
+                'A user can have at most {} active games'.format(
+                    MAX_ACTIVE_GAMES))
+
+    def update(self, game, removed=False):
+        """Updates the summary of a game, removing it if the game is over or
+        removed is True"""
+        entries = [entry for entry in self.games if entry.game != game.key]
+        if not (removed or game.game_over):
+            entry = ActiveGame(game=game.key,
+                               attempts_remaining=game.attempts_remaining,
+                               obscured_target=game.obscured_target)
+            # Keep the game's place in the list
+            for index, old in enumerate(self.games):
+                if old.game == game.key:
+                    entries.insert(index, entry)
+                    break
+            else:
+                entries.append(entry)
+        self.games = entries
+
+
+class Game(UserNameMixin, ndb.Model):
     """Game object"""
     target = ndb.StringProperty(required=True)
     obscured_target= ndb.StringProperty(required=True)
-    attempts_remaining = ndb.IntegerProperty(required=True, default=8)
+    attempts_remaining = ndb.IntegerProperty(required=True,
+                                            default=engine.DEFAULT_ATTEMPTS)
     game_over = ndb.BooleanProperty(required=True, default=False)
-    tried_letters_were_wrong = ndb.StringProperty(required=True)
-    correct_letters = ndb.StringProperty(required=True)
-    all_guesses = ndb.StringProperty(required=True)
+    # Moves that changed the game, packed by movelog.py
+    move_log = ndb.BlobProperty(default='')
+    # History of games saved before move_log, converted to a move log the
+    # next time the game is played or by migrations.convert_move_logs
+    tried_letters_were_wrong = ndb.StringProperty()
+    correct_letters = ndb.StringProperty()
+    all_guesses = ndb.StringProperty()
     user = ndb.KeyProperty(required=True, kind='User')
+    # Copy of the user's name, so forms don't need to fetch the User
+    user_name = ndb.StringProperty(indexed=False)
+    # Day the game ended, finished games are archived some days after it
+    ended = ndb.DateProperty()
+    # Bumped on every put, so gamecache never replaces a newer cached copy
+    version = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+    # Games are cached by gamecache, not ndb's own memcache layer. Bulk
+    # imports and creations turn off caching saved games.
+    _use_memcache = False
+    cache_on_put = True
+
+    # Attempts used by guesses applied since the game was loaded or saved,
+    # which the running totals of active games don't include yet
+    _attempts_used = 0
+    # Engine of the last guess applied, with the fields it was in step with
+    _state = None
+
+    def _pre_put_hook(self):
+        self.version += 1
+
+    def _post_put_hook(self, future):
+        if self.cache_on_put and future.get_exception() is None:
+            gamecache.on_commit(gamecache.store, self)
 
     @classmethod
-    def new_game(cls, user, min, max):
-        """Creates and returns a new game"""
+    def _post_delete_hook(cls, key, future):
+        if future.get_exception() is None:
+            gamecache.on_commit(gamecache.evict, key)
+
+    @classmethod
+    def new_game(cls, user, min, max, dictionary=words.DEFAULT_DICTIONARY,
+                 difficulty=None):
+        """Creates and returns a new game for a User entity. Raises
+        TooManyGamesError if the user has MAX_ACTIVE_GAMES active games."""
 
         if max < min:
             raise ValueError('Maximum must be greater than minimum')
 
-        # Use min and max to make a list of acceptable words
-        # from a dictionary file
-        acceptable_words = []
-        for word in WORDS:
-            if len(word) >= min and len(word)<=max:
-                acceptable_words.append(word)
-
-        # Make the word lower case
-        word_to_use = random.choice(acceptable_words).lower()
+        # Draw a lower case word of the difficulty with a length between min
+        # and max. Raises UnknownDictionaryError or UnknownDifficultyError if
+        # there is no such dictionary or difficulty and NoWordsError if the
+        # dictionary has no such word.
+        word_to_use = words.get(dictionary).random_word(min, max, difficulty)
         hidden_word = ''
         # Make a copy of the word with letters obscured
         for letter in word_to_use:
             hidden_word = hidden_word + "$"
 
-        game = Game(user=user,
+        game = Game(user=user.key,
+                    user_name=user.name,
                     target=word_to_use,
                     obscured_target=hidden_word,
-                    tried_letters_were_wrong="",
-                    correct_letters="",
-                    all_guesses="",
                     game_over=False,
-                    parent=user)
+                    parent=user.key)
 
-        game.put()
+        game.put_tracked(started=True)
         return game
 
+    @classmethod
+    def new_games(cls, users, rounds, min, max,
+                  dictionary=words.DEFAULT_DICTIONARY, difficulty=None):
+        """Creates a game for every User entity in each of a number of rounds,
+        every game of a round having the same word. Returns the games, round
+        by round. Raises the errors of new_game, and the datastore error of
+        any user whose transaction failed, in which case the games of the
+        other users may have been created."""
+        if max < min:
+            raise ValueError('Maximum must be greater than minimum')
+        index = words.get(dictionary)
+        targets = [index.random_word(min, max, difficulty)
+                   for _ in range(rounds)]
+        # Checked again in each user's transaction, but checking every user
+        # first avoids creating the games of only some of them
+        futures = [ActiveGames.get_for_async(user.key) for user in users]
+        for future in futures:
+            future.get_result().check_room(rounds)
+
+        # One transaction per user, all running at once
+        futures = [_create_games(user, targets) for user in users]
+        ndb.Future.wait_all(futures)
+        games_by_user = [future.get_result() for future in futures]
+        return [user_games[i] for i in range(rounds)
+                for user_games in games_by_user]
+
+    def upgrade_history(self):
+        """Converts the history strings of a game saved before move_log into
+        its move log, without saving the game. Returns True if there was
+        anything to convert."""
+        if self.all_guesses is None:
+            return False
+        self.move_log = movelog.from_guesses(
+            self.target, self.attempts_remaining, self.all_guesses)
+        self.all_guesses = None
+        self.correct_letters = None
+        self.tried_letters_were_wrong = None
+        return True
+
+    def apply_guess(self, guess):
+        """Applies a guess to the game's state without saving it. Returns the
+        engine outcome of the guess."""
+        state = self._engine()
+        outcome = state.guess(guess)
+        if outcome in engine.ACCEPTED:
+            self.move_log += movelog.record(str(guess.lower()), outcome)
+            self.obscured_target = state.obscured_target
+            self._attempts_used += (self.attempts_remaining -
+                                    state.attempts_remaining)
+            self.attempts_remaining = state.attempts_remaining
+            self._state = (state, self.move_log)
+        return outcome
+
+    def _engine(self):
+        """Returns the Engine of the game's state. The engine of the last
+        guess applied is reused as long as the game was not changed since,
+        so several guesses applied to one entity build it only once."""
+        if self._state is not None:
+            state, move_log = self._state
+            if (move_log == self.move_log and
+                    state.attempts_remaining == self.attempts_remaining and
+                    state.obscured_target == self.obscured_target):
+                return state
+        self.upgrade_history()
+        state = engine.Engine(self.target, self.attempts_remaining,
+                              movelog.letters(self.move_log),
+                              self.obscured_target)
+        self._state = (state, self.move_log)
+        return state
+
+    def apply_guesses(self, guesses):
+        """Applies guesses in order without saving them, stopping once the
+        game is over. Returns the engine outcome of each guess applied with
+        the obscured target after it."""
+        moves = []
+        for guess in guesses:
+            outcome = self.apply_guess(guess)
+            moves.append((outcome, self.obscured_target))
+            if outcome in (engine.GAME_OVER, engine.WON, engine.LOST):
+                break
+        return moves
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def make_move(cls, key, guess):
+        """Applies a guess to the saved state of a game and saves the result,
+        ending the game if the guess won or lost it. Runs in a transaction,
+        so concurrent guesses on the same game are applied one after the
+        other instead of overwriting each other. Returns the game and the
+        outcome of the guess, or None and None if the game was deleted."""
+        game = key.get()
+        if game is None:
+            return None, None
+        outcome = game.apply_guess(guess)
+        if outcome in (engine.WON, engine.LOST):
+            game.end_game(outcome == engine.WON)
+        elif outcome in engine.ACCEPTED:
+            game.put_tracked()
+        return game, outcome
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def make_moves(cls, key, guesses):
+        """Applies guesses in order to the saved state of a game, like
+        make_move, but reads and saves the game only once. Returns the game and
+        the moves of apply_guesses, or None and None if the game was
+        deleted."""
+        game = key.get()
+        if game is None:
+            return None, None
+        moves = game.apply_guesses(guesses)
+        if any(outcome in engine.ACCEPTED for outcome, _ in moves):
+            if moves[-1][0] in (engine.WON, engine.LOST):
+                game.end_game(moves[-1][0] == engine.WON)
+            else:
+                game.put_tracked()
+        return game, moves
+
+    def put_tracked(self, started=False):
+        """Saves the game, updating the running totals of active games in the
+        same transaction. started is True for new games. Games that end are
+        saved by end_game instead."""
+        used, self._attempts_used = self._attempts_used, 0
+        if started:
+            _save_tracked(self, 1, self.attempts_remaining).get_result()
+        else:
+            _save_tracked(self, 0, -used).get_result()
+
+    @ndb.transactional(xg=True)
+    def cancel(self):
+        """Deletes the game if it is not over, taking it out of the running
+        totals of active games. The game is read again in the transaction,
+        so a game that just ended is not cancelled. Returns True if the game
+        was deleted."""
+        game = self.key.get()
+        if game is None or game.game_over:
+            return False
+        _delete_tracked(game, -1, -game.attempts_remaining).get_result()
+        return True
+
     def to_form(self, message):
         """Returns a GameForm representation of the Game"""
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
+        form.user_name = self.get_user_name()
         form.attempts_remaining = self.attempts_remaining
         form.game_over = self.game_over
         form.message = message
+        form.obscured_target = self.obscured_target
         return form
 
-    def to_game_history_form(self):
-        """Returns a form representation of the history of a game"""
-
-        formatted_all_letters = "Order of guesses: "
-        formatted_correct_letters = "Order of correct guesses: "
-        formatted_wrong_letters = "Order of incorrect guesses: "
-
-        correct_list = list(self.correct_letters)
-        wrong_list = list(self.tried_letters_were_wrong)
-        all_list = list(self.all_guesses)
-
-        # Make formatted strings for all, good, bad guesses
-        for idx, val in enumerate(all_list):
-            if (idx + 1) == len(all_list):
-                formatted_all_letters = formatted_all_letters + \
-                                            ("%s: %s" % ((idx+1), val))
-            else:
-                formatted_all_letters = formatted_all_letters + \
-                                            ("%s: %s, " % ((idx+1), val))
-
-        for idx, val in enumerate(correct_list):
-            if (idx + 1) == len(correct_list):
-                formatted_correct_letters = formatted_correct_letters + \
-                                            ("%s: %s" % ((idx+1), val))
-            else:
-                formatted_correct_letters = formatted_correct_letters + \
-                                            ("%s: %s, " % ((idx+1), val))
-
-        for idx, val in enumerate(wrong_list):
-            if (idx + 1) == len(wrong_list):
-                formatted_wrong_letters = formatted_wrong_letters + \
-                                          ("%s: %s" % ((idx+1), val))
+    def to_game_history_form(self, start=0, page_size=None, at_move=None,
+                             compact=False):
+        """Returns a form representation of the history of a game, holding
+        the moves from start, at most page_size of them. If at_move is given,
+        the history stops after that many moves and the state of the game is
+        its state at that point, replayed from the move log. If compact is
+        True, the moves are only given as HistoryMoveForms, without the
+        strings listing them."""
+        self.upgrade_history()
+        total = movelog.count(self.move_log)
+        at_move = total if at_move is None else min(at_move, total)
+        stop = at_move if page_size is None else min(at_move, start + page_size)
+        if at_move < total:
+            state = movelog.replay(self.target, self.move_log,
+                                   self.attempts_remaining, at_move)
+            attempts_remaining = state.attempts_remaining
+            game_over = state.game_over
+            obscured_target = state.obscured_target
+        else:
+            attempts_remaining = self.attempts_remaining
+            game_over = self.game_over
+            obscured_target = self.obscured_target
+
+        # Moves before the page still count towards the numbering
+        correct_count = sum(1 for code in bytearray(
+            self.move_log[1:start * movelog.RECORD.size:movelog.RECORD.size])
+                            if code in movelog.FOUND_CODES)
+        wrong_count = min(start, total) - correct_count
+        all_moves, correct_moves, wrong_moves, moves = [], [], [], []
+        for number, (letter, outcome, made_at) in enumerate(
+                movelog.moves(self.move_log, start, stop), start + 1):
+            all_moves.append('%s: %s' % (number, letter))
+            if outcome in engine.FOUND:
+                correct_count += 1
+                correct_moves.append('%s: %s' % (correct_count, letter))
             else:
-                formatted_wrong_letters = formatted_wrong_letters + \
-                                          ("%s: %s, " % ((idx+1), val))
-
-        return GameHistoryForm(urlsafe_key=self.key.urlsafe(),
-                               attempts_remaining=self.attempts_remaining,
-                               game_over=self.game_over,
-                               user_name=self.user.get().name,
-                               correct_moves=formatted_correct_letters,
-                               wrong_moves=formatted_wrong_letters,
-                               all_moves=formatted_all_letters,
-                               last_game_state=self.obscured_target)
-
-
-
-    def to_user_games_form(self):
-        """Returns a UserGamesForm representation of the Game"""
-
-        return GameForm(urlsafe_key=self.key.urlsafe(),
-                        attempts_remaining=self.attempts_remaining,
-                        game_over=self.game_over, message='Game in Progress',
-                        user_name=self.user.get().name)
-
+                wrong_count += 1
+                wrong_moves.append('%s: %s' % (wrong_count, letter))
+            moves.append(HistoryMoveForm(
+                number=number, guess=letter, outcome=outcome,
+                made_at=made_at and made_at.isoformat()))
+
+        form = GameHistoryForm(urlsafe_key=self.key.urlsafe(),
+                               attempts_remaining=attempts_remaining,
+                               game_over=game_over,
+                               user_name=self.get_user_name(),
+                               last_game_state=obscured_target,
+                               moves=moves,
+                               next_start=stop if stop < at_move else None)
+        if not compact:
+            form.correct_moves = ('Order of correct guesses: ' +
+                                  ', '.join(correct_moves))
+            form.wrong_moves = ('Order of incorrect guesses: ' +
+                                ', '.join(wrong_moves))
+            form.all_moves = 'Order of guesses: ' + ', '.join(all_moves)
+        return form
 
     def deleted_game_form(self, message):
         return DeleteGameForm(urlsafe_key=self.key.urlsafe(),
@@ -141,52 +625,81 @@ class Game(ndb.Model):
 
     def end_game(self, won=False):
         """Ends the game - if won is True, the player won. - if won is False,
-        the player lost."""
+        the player lost. The game, the user's totals and the new Score are
+        saved together in one transaction, so games ending at the same time
+        can't lose each other's updates to the user. Returns the Score."""
         self.game_over = True
-        self.put()
+        self.ended = date.today()
 
-        # Give game score
-        if won is True:
-            game_score = self.attempts_remaining * len(self.target)
-        else:
-            game_score = 0
-
-        # Add game score and game to user properties
-        user = self.user.get()
-        user.total_game_score = user.total_game_score + game_score
-        user.total_games_played = user.total_games_played + 1
-
-        user.user_score = (user.total_game_score/user.total_games_played)
+        game_score = engine.score(self.target, won is True,
+                                  self.attempts_remaining)
 
-        user.put()
-
-        # Add the game to the score 'board'
-        score = Score(user=self.user, date=date.today(), won=won,
-                      game_score=game_score)
-        score.put()
+        used, self._attempts_used = self._attempts_used, 0
+        return _end_game(self, won, game_score,
+                         -(self.attempts_remaining + used)).get_result()
 
 
-class Score(ndb.Model):
+class Score(UserNameMixin, ndb.Model):
     """Score object"""
     user = ndb.KeyProperty(required=True, kind='User')
+    # Copy of the user's name, so forms don't need to fetch the User
+    user_name = ndb.StringProperty(indexed=False)
     date = ndb.DateProperty(required=True)
     won = ndb.BooleanProperty(required=True)
     game_score = ndb.IntegerProperty(required=True)
 
-    def to_form(self):
-        return ScoreForm(user_name=self.user.get().name, won=self.won,
-                         date=str(self.date), game_score=self.game_score)
+    def to_form(self, user_name=None):
+        """Returns a ScoreForm representation of the Score. Pass user_name
+        when it is already known, e.g. for projections."""
+        return ScoreForm(user_name=user_name or self.get_user_name(),
+                         won=self.won, date=str(self.date),
+                         game_score=self.game_score)
+
+
+class DailyScore(ndb.Model):
+    """Scores of a User on one day, rolled up from Scores older than the
+    retention period by compaction.py. A child of the user, keyed by date."""
+    date = ndb.DateProperty(required=True)
+    games = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    wins = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    total_score = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    best_score = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+    @classmethod
+    def key_for(cls, user_key, day):
+        return ndb.Key(cls, day.isoformat(), parent=user_key)
+
+    def add(self, score):
+        """Adds a Score of the user on the day"""
+        self.games += 1
+        self.wins += 1 if score.won else 0
+        self.total_score += score.game_score
+        self.best_score = max(self.best_score, score.game_score)
+
 
 class GameHistoryForm(messages.Message):
-    """Form for displaying game history"""
+    """Form for displaying game history. Not modified responses only hold
+    urlsafe_key and etag, compact ones leave out the move strings."""
     urlsafe_key = messages.StringField(1, required=True)
-    attempts_remaining = messages.IntegerField(2, required=True)
-    game_over = messages.BooleanField(3, required=True)
-    user_name = messages.StringField(4, required=True)
-    correct_moves = messages.StringField(5, required=True)
-    wrong_moves = messages.StringField(6, required=True)
-    all_moves = messages.StringField(7, required=True)
-    last_game_state = messages.StringField(8, required=True)
+    attempts_remaining = messages.IntegerField(2)
+    game_over = messages.BooleanField(3)
+    user_name = messages.StringField(4)
+    correct_moves = messages.StringField(5)
+    wrong_moves = messages.StringField(6)
+    all_moves = messages.StringField(7)
+    last_game_state = messages.StringField(8)
+    moves = messages.MessageField('HistoryMoveForm', 9, repeated=True)
+    next_start = messages.IntegerField(10)
+    etag = messages.StringField(11)
+    not_modified = messages.BooleanField(12, default=False)
+
+
+class HistoryMoveForm(messages.Message):
+    """One move of a game history"""
+    number = messages.IntegerField(1, required=True)
+    guess = messages.StringField(2, required=True)
+    outcome = messages.StringField(3, required=True)
+    made_at = messages.StringField(4)
 
 class GameForm(messages.Message):
     """GameForm for outbound game state information"""
@@ -195,6 +708,7 @@ class GameForm(messages.Message):
     game_over = messages.BooleanField(3, required=True)
     message = messages.StringField(4, required=True)
     user_name = messages.StringField(5, required=True)
+    obscured_target = messages.StringField(6)
 
 class DeleteGameForm(messages.Message):
     """Form to report confirmation of deleted games"""
@@ -205,6 +719,7 @@ class DeleteGameForm(messages.Message):
 class UserGamesForm(messages.Message):
     """Form for outbound information about active user games"""
     games = messages.MessageField(GameForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
 
 
 class NewGameForm(messages.Message):
@@ -212,6 +727,8 @@ class NewGameForm(messages.Message):
     user_name = messages.StringField(1, required=True)
     min = messages.IntegerField(2, default=1)
     max = messages.IntegerField(3, default=10)
+    dictionary = messages.StringField(4, default=words.DEFAULT_DICTIONARY)
+    difficulty = messages.StringField(5)
 
 
 class MakeMoveForm(messages.Message):
@@ -219,6 +736,38 @@ class MakeMoveForm(messages.Message):
     guess = messages.StringField(1, required=True)
 
 
+class MakeMovesForm(messages.Message):
+    """Used to make several moves in an existing game"""
+    guesses = messages.StringField(1, repeated=True)
+
+
+class MoveForm(messages.Message):
+    """Outcome of one guess of a MakeMovesForm"""
+    guess = messages.StringField(1, required=True)
+    message = messages.StringField(2, required=True)
+
+
+class MovesForm(messages.Message):
+    """Outcomes of the guesses applied, and the game state after them"""
+    moves = messages.MessageField(MoveForm, 1, repeated=True)
+    game = messages.MessageField(GameForm, 2, required=True)
+
+
+class NewGamesForm(messages.Message):
+    """Used to create games for several users, in rounds"""
+    user_names = messages.StringField(1, repeated=True)
+    rounds = messages.IntegerField(2, default=1)
+    min = messages.IntegerField(3, default=1)
+    max = messages.IntegerField(4, default=10)
+    dictionary = messages.StringField(5, default=words.DEFAULT_DICTIONARY)
+    difficulty = messages.StringField(6)
+
+
+class GameForms(messages.Message):
+    """Return multiple GameForms"""
+    games = messages.MessageField(GameForm, 1, repeated=True)
+
+
 class ScoreForm(messages.Message):
     """ScoreForm for outbound Score information"""
     user_name = messages.StringField(1, required=True)
@@ -227,14 +776,31 @@ class ScoreForm(messages.Message):
     game_score = messages.IntegerField(4, required=True)
 
 
+class ScoreColumnsForm(messages.Message):
+    """The fields of a list of ScoreForms, one list per field"""
+    user_names = messages.StringField(1, repeated=True)
+    dates = messages.StringField(2, repeated=True)
+    won = messages.BooleanField(3, repeated=True)
+    game_scores = messages.IntegerField(4, repeated=True)
+
+
 class ScoreForms(messages.Message):
-    """Return multiple ScoreForms"""
+    """Return multiple ScoreForms, or their columns if compact"""
     scores = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    columns = messages.MessageField(ScoreColumnsForm, 3)
+    etag = messages.StringField(4)
+    not_modified = messages.BooleanField(5, default=False)
 
 
 class ScoreBoard(messages.Message):
-    """Return high scores in descending order"""
+    """Return high scores in descending order, or their columns if
+    compact"""
     high_scores = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    columns = messages.MessageField(ScoreColumnsForm, 3)
+    etag = messages.StringField(4)
+    not_modified = messages.BooleanField(5, default=False)
 
 
 class UserRankingForm(messages.Message):
@@ -244,8 +810,52 @@ class UserRankingForm(messages.Message):
 
 
 class MultiUserRankingForm(messages.Message):
-    """Form for returning multiple user ranking forms"""
+    """Form for returning multiple user ranking forms, or their fields as
+    lists if compact"""
     rankings = messages.MessageField(UserRankingForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    user_names = messages.StringField(3, repeated=True)
+    user_scores = messages.FloatField(4, repeated=True)
+    etag = messages.StringField(5)
+    not_modified = messages.BooleanField(6, default=False)
+
+
+class CacheStatsForm(messages.Message):
+    """Hit and miss counts of a cache"""
+    hits = messages.IntegerField(1, required=True)
+    misses = messages.IntegerField(2, required=True)
+
+
+class ThrottleStatsForm(messages.Message):
+    """Counts of requests allowed and throttled by the rate limits, of
+    requests the instance's own limits decided alone and of contention
+    errors"""
+    allowed = messages.IntegerField(1, required=True)
+    throttled_games = messages.IntegerField(2, required=True)
+    throttled_users = messages.IntegerField(3, required=True)
+    local_only = messages.IntegerField(4, required=True)
+    contention = messages.IntegerField(5, required=True)
+
+
+class CountForm(messages.Message):
+    """Average count of an event per request"""
+    name = messages.StringField(1, required=True)
+    average = messages.FloatField(2, required=True)
+
+
+class EndpointStatsForm(messages.Message):
+    """Totals of the sampled requests to an endpoint"""
+    endpoint = messages.StringField(1, required=True)
+    calls = messages.IntegerField(2, required=True)
+    average_ms = messages.FloatField(3, required=True)
+    max_ms = messages.FloatField(4, required=True)
+    counts = messages.MessageField(CountForm, 5, repeated=True)
+
+
+class EndpointStatsForms(messages.Message):
+    """Return multiple EndpointStatsForms"""
+    endpoints = messages.MessageField(EndpointStatsForm, 1, repeated=True)
+    sample_rate = messages.FloatField(2, required=True)
 
 
 class StringMessage(messages.Message):
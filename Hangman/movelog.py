@@ -0,0 +1,72 @@
+"""movelog.py - Packed, append-only log of the moves of a game.
+
+Each move that changed a game is a RECORD of its letter, its outcome and the
+time it was made, in seconds since the epoch. Moves converted from games saved
+before there was a log have no time, stored as 0. Records are fixed size, so a
+range of moves is a slice of the log, and every letter guessed is the slice
+taking the first byte of each record."""
+
+import struct
+import time
+from datetime import datetime
+
+import engine
+
+RECORD = struct.Struct('>BBI')
+
+# Outcome codes stored in the log, the position of the outcome in OUTCOMES
+OUTCOMES = (engine.CORRECT, engine.WRONG, engine.WON, engine.LOST)
+OUTCOME_CODES = dict((outcome, code) for code, outcome in enumerate(OUTCOMES))
+FOUND_CODES = frozenset(OUTCOME_CODES[outcome] for outcome in engine.FOUND)
+
+
+def record(letter, outcome, when=None):
+    """Returns the record of a move, made now unless when is given"""
+    if when is None:
+        when = time.time()
+    return RECORD.pack(ord(letter), OUTCOME_CODES[outcome], int(when))
+
+
+def count(log):
+    """Returns the number of moves in a log"""
+    return len(log) // RECORD.size
+
+
+def letters(log):
+    """Returns the letters guessed in a log, in order"""
+    return log[::RECORD.size]
+
+
+def moves(log, start=0, stop=None):
+    """Yields the letter, outcome and time (a datetime, or None when it is not
+    known) of the moves of a log from start up to, not including, stop"""
+    end = len(log) if stop is None else min(len(log), stop * RECORD.size)
+    for offset in xrange(start * RECORD.size, end, RECORD.size):
+        letter, code, when = RECORD.unpack_from(log, offset)
+        yield (chr(letter), OUTCOMES[code],
+               datetime.utcfromtimestamp(when) if when else None)
+
+
+def initial_attempts(log, attempts_remaining):
+    """Returns the attempts a game started with, from its log and the attempts
+    it has remaining"""
+    wrong = sum(1 for code in bytearray(log[1::RECORD.size])
+                if code not in FOUND_CODES)
+    return attempts_remaining + wrong
+
+
+def replay(target, log, attempts_remaining, stop):
+    """Returns the Engine of a game after its first stop moves"""
+    state = engine.Engine(target, initial_attempts(log, attempts_remaining))
+    for letter in letters(log)[:stop]:
+        state.guess(letter)
+    return state
+
+
+def from_guesses(target, attempts_remaining, guesses):
+    """Returns the log of a game saved with only the string of its guesses,
+    replaying them to find their outcomes. Their times are not known."""
+    wrong = sum(1 for letter in set(guesses) if letter not in target)
+    state = engine.Engine(target, attempts_remaining + wrong)
+    return ''.join(record(letter, state.guess(letter), 0)
+                   for letter in guesses)
@@ -0,0 +1,141 @@
+"""ratelimit.py - Token bucket rate limits on games and players.
+
+A client looping on get_game or make_move for one game keeps hitting the
+game's entity group, and the contention slows down every other request on
+it. Each request on a game takes a token from the bucket of the game and from
+the bucket of its player, the User the game is a child of. Buckets refill at
+a steady rate up to a burst size, set per scope in LIMITS, and a request
+finding either bucket empty is throttled.
+
+Buckets are kept in memcache, shared by all instances, and updated with
+compare-and-set. Each instance also keeps buckets of its own, checked first:
+the requests an instance sees are a subset of all requests, so when its
+bucket is empty the shared one is too, and a client looping on one instance
+is throttled without an RPC. When memcache can't be updated, the instance's
+buckets decide alone.
+
+Requests allowed, throttled and decided by the instance alone, and the
+contention errors of the endpoints, are counted per instance and added to
+shared memcache counters every STATS_FLUSH_EVERY events."""
+
+import threading
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_NAMESPACE = 'rate_limits'
+STATS_NAMESPACE = 'rate_limit_stats'
+STATS_FLUSH_EVERY = 100
+CAS_RETRIES = 3
+# Requests per second and burst size of each scope
+LIMITS = {
+    'game': (5.0, 20),
+    'user': (20.0, 60),
+}
+# Idle buckets are dropped once they would have refilled
+EXPIRES = int(max(burst / rate for rate, burst in LIMITS.values())) + 1
+LOCAL_BUCKETS = 10000
+
+EVENTS = ('allowed', 'throttled_games', 'throttled_users', 'local_only',
+          'contention')
+
+_local_buckets = {}
+_local_lock = threading.Lock()
+_stats = dict((event, 0) for event in EVENTS)
+_stats_lock = threading.Lock()
+
+
+class Throttled(Exception):
+    """Raised when a bucket of a request is empty. retry_after is the number
+    of seconds until it holds a token again."""
+
+    def __init__(self, scope, retry_after):
+        super(Throttled, self).__init__(
+            'Too many requests for this {}'.format(scope))
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def count(event):
+    """Counts an event of EVENTS"""
+    with _stats_lock:
+        _stats[event] += 1
+        if sum(_stats.itervalues()) < STATS_FLUSH_EVERY:
+            return
+        pending = dict((event, value) for event, value in _stats.iteritems()
+                       if value)
+        for event in EVENTS:
+            _stats[event] = 0
+    memcache.offset_multi(pending, namespace=STATS_NAMESPACE,
+                          initial_value=0)
+
+
+def stats():
+    """Returns the count of each event of all instances, as flushed so far"""
+    counts = memcache.get_multi(EVENTS, namespace=STATS_NAMESPACE)
+    return dict((event, counts.get(event, 0)) for event in EVENTS)
+
+
+def _take(buckets, values, now):
+    """Returns the values of buckets, tokens and time updated, after taking a
+    token from each. Raises Throttled if one of them is empty."""
+    taken = {}
+    for scope, name in buckets:
+        rate, burst = LIMITS[scope]
+        tokens, updated = values.get(name) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            raise Throttled(scope, (1 - tokens) / rate)
+        taken[name] = (tokens - 1, now)
+    return taken
+
+
+def _take_local(buckets, now):
+    with _local_lock:
+        taken = _take(buckets, _local_buckets, now)
+        if len(_local_buckets) >= LOCAL_BUCKETS:
+            _local_buckets.clear()
+        _local_buckets.update(taken)
+
+
+def _take_shared(buckets, now):
+    """Takes a token from each shared bucket. Returns False if memcache could
+    not be updated."""
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        values = client.get_multi([name for _, name in buckets],
+                                  namespace=MEMCACHE_NAMESPACE, for_cas=True)
+        taken = _take(buckets, values, now)
+        failed = []
+        new = dict((name, value) for name, value in taken.iteritems()
+                   if name not in values)
+        if new:
+            failed.extend(client.add_multi(new, time=EXPIRES,
+                                           namespace=MEMCACHE_NAMESPACE))
+        updated = dict((name, value) for name, value in taken.iteritems()
+                       if name in values)
+        if updated:
+            failed.extend(client.cas_multi(updated, time=EXPIRES,
+                                           namespace=MEMCACHE_NAMESPACE))
+        if not failed:
+            return True
+        # Only take again from the buckets that lost a race
+        buckets = [(scope, name) for scope, name in buckets if name in failed]
+    return False
+
+
+def check(game_key):
+    """Takes a token from the buckets of a game and of its player. Raises
+    Throttled if either is empty."""
+    buckets = [('game', 'game:' + game_key.urlsafe())]
+    if game_key.parent() is not None:
+        buckets.append(('user', 'user:' + game_key.parent().urlsafe()))
+    now = time.time()
+    try:
+        _take_local(buckets, now)
+        if not _take_shared(buckets, now):
+            count('local_only')
+    except Throttled as throttled:
+        count('throttled_{}s'.format(throttled.scope))
+        raise
+    count('allowed')
@@ -0,0 +1,290 @@
+"""reconcile.py - Reconciliation of User totals with their Scores, and of the
+running totals of active games with the games.
+
+A user's total_game_score, total_games_played and user_score are added to as
+games end, so a failure or a bug can leave them out of line with the user's
+Scores and the DailyScores rolled up from them, and the user rankings are
+built on them. A run walks Users in batches, one task per batch. For each
+user it streams the Scores and DailyScores, summing them without holding
+them in memory, and repairs users whose totals differ in one transaction per
+user. All the users of a batch are checked and repaired at the same time.
+
+The first run checks every user. Later runs only check users saved since the
+run before, as every change to a user's Scores or DailyScores saves the user
+too: ending a game saves the user with its new Score, and compaction.py saves
+the user when it rolls up Scores. Queries on Scores are only eventually
+consistent, so a run stops SETTLE_SECONDS before it started, and leaves
+users saved after that point to the next run.
+
+The progress of the current run is saved on the ReconcileJob after every
+batch. Starting a run while one is in progress resumes it instead.
+
+The running totals of active games and of their attempts remaining are
+recounted by an ActiveGamesJob the same way, a batch of games per task.
+Games keep being played during a run, so the recount can differ from the
+totals read when the run started even when they are right. A run only
+corrects the drift that the run before found too, in the same direction and
+no more of it than either run found, and keeps the rest for the next run to
+confirm. The job is only advanced by the task of its current batch, in a
+transaction, and the correction is made in the transaction ending the run,
+so a retried or duplicated task never counts a batch or corrects the totals
+twice."""
+
+import logging
+from datetime import datetime, timedelta
+
+from google.appengine.ext import ndb
+
+import counters
+import leaderboard
+from models import User, Game, Score, DailyScore, user_score, \
+    track_active_games_async, ACTIVE_GAMES_COUNTER, ACTIVE_ATTEMPTS_COUNTER
+from utils import add_named_task, next_batch
+
+BATCH_SIZE = 100
+SCORE_BATCH_SIZE = 500
+SETTLE_SECONDS = 300
+QUEUE_URL = '/tasks/reconcile/users'
+GAMES_BATCH_SIZE = 1000
+GAMES_QUEUE_URL = '/tasks/cache_average_attempts'
+
+
+class ReconcileJob(ndb.Model):
+    """Progress of the reconciliation of user totals. checkpoint is the point
+    up to which users have been checked, cutoff the point the current run
+    checks users up to, or None if no run is in progress."""
+    checkpoint = ndb.DateTimeProperty(indexed=False)
+    cutoff = ndb.DateTimeProperty(indexed=False)
+    full = ndb.BooleanProperty(required=True, default=False, indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    batch = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    checked = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    repaired = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+def _add_task(job):
+    """Queues the task of the next batch of a run"""
+    add_named_task('reconcile-users-{:%Y%m%d%H%M%S}-{}'.format(job.cutoff,
+                                                              job.batch),
+                   QUEUE_URL)
+
+
+def start(full=False):
+    """Starts a run checking the users saved since the last run, or every
+    user if full is True or there was no run before. Resumes the current run
+    instead if there is one."""
+    job = ReconcileJob.get_or_insert('users')
+    if job.cutoff is None:
+        job.cutoff = datetime.now() - timedelta(seconds=SETTLE_SECONDS)
+        job.full = full or job.checkpoint is None
+        job.cursor = None
+        job.batch = job.checked = job.repaired = 0
+        job.put()
+    _add_task(job)
+
+
+@ndb.tasklet
+def _sum_async(query, add):
+    """Returns the sum of add(entity) over the results of a query, read a
+    batch at a time"""
+    total = (0, 0)
+    results = query.iter(batch_size=SCORE_BATCH_SIZE)
+    while (yield results.has_next_async()):
+        games, score = add(results.next())
+        total = (total[0] + games, total[1] + score)
+    raise ndb.Return(total)
+
+
+@ndb.tasklet
+def _totals_async(user_key):
+    """Returns the number of games and total score of a user's Scores and
+    DailyScores"""
+    scores, days = yield (
+        _sum_async(Score.query(Score.user == user_key,
+                               projection=[Score.game_score]),
+                   lambda score: (1, score.game_score)),
+        _sum_async(DailyScore.query(ancestor=user_key),
+                   lambda day: (day.games, day.total_score)))
+    raise ndb.Return(scores[0] + days[0], scores[1] + days[1])
+
+
+def _drifted(user, games, total):
+    return (user.total_games_played, user.total_game_score,
+            user.user_score) != (games, total, user_score(total, games))
+
+
+@ndb.transactional_tasklet
+def _repair_async(user_key, games, total, cutoff):
+    """Sets the totals of a user, unless it was saved after cutoff and its
+    totals may be newer than the sums. Returns the user if it was
+    repaired."""
+    user = yield user_key.get_async()
+    if (user is None or user.updated is not None and user.updated >= cutoff
+            or not _drifted(user, games, total)):
+        raise ndb.Return(None)
+    logging.warning('Repairing the totals of user %s from %d games, %d '
+                    'points to %d games, %d points', user.name,
+                    user.total_games_played, user.total_game_score, games,
+                    total)
+    user.set_totals(total, games)
+    yield user.put_async()
+    raise ndb.Return(user)
+
+
+@ndb.tasklet
+def _check_async(user, cutoff):
+    """Repairs a user if its totals differ from its scores. Returns the
+    user if it was repaired."""
+    games, total = yield _totals_async(user.key)
+    repaired = None
+    if _drifted(user, games, total):
+        repaired = yield _repair_async(user.key, games, total, cutoff)
+    raise ndb.Return(repaired)
+
+
+def reconcile_batch():
+    """Checks the next batch of users of the current run and queues the next
+    batch. Returns the number of users repaired."""
+    job = ReconcileJob.get_or_insert('users')
+    if job.cutoff is None:
+        return 0
+    if job.full:
+        query = User.query()
+    else:
+        query = User.query(User.updated >= job.checkpoint,
+                           User.updated < job.cutoff)
+    users, cursor = next_batch(query, job.cursor, BATCH_SIZE)
+
+    # Every user of the batch is checked at the same time
+    futures = [_check_async(user, job.cutoff) for user in users]
+    repaired = [user for user in (future.get_result() for future in futures)
+                if user]
+    for user in repaired:
+        leaderboard.record_user(user)
+
+    job.checked += len(users)
+    job.repaired += len(repaired)
+    job.cursor = cursor
+    job.batch += 1
+    if cursor is None:
+        logging.info('Checked %d users, repaired %d', job.checked,
+                     job.repaired)
+        job.checkpoint = job.cutoff
+        job.cutoff = None
+    job.put()
+    if job.cutoff is not None:
+        _add_task(job)
+    return len(repaired)
+
+
+class ActiveGamesJob(ndb.Model):
+    """Progress of the recount of active games. started is the start of the
+    current run, or None if no run is in progress, and base_count and
+    base_total the running totals when it started. drift_count and
+    drift_total are the drift found by the last run and not corrected
+    yet."""
+    started = ndb.DateTimeProperty(indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    batch = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    total = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    base_count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    base_total = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    drift_count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    drift_total = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+def _add_games_task(job):
+    """Queues the task of the current batch of a recount"""
+    add_named_task('active-games-{:%Y%m%d%H%M%S}-{}'.format(job.started,
+                                                           job.batch),
+                   GAMES_QUEUE_URL, params={'batch': job.batch})
+
+
+@ndb.transactional
+def _start_games(base_count, base_total):
+    job = ActiveGamesJob.get_or_insert('active_games')
+    if job.started is None:
+        job.started = datetime.now()
+        job.cursor = None
+        job.batch = job.count = job.total = 0
+        job.base_count, job.base_total = base_count, base_total
+        job.put()
+    return job
+
+
+def start_games():
+    """Starts recounting the active games, or resumes the current run if
+    there is one"""
+    job = _start_games(counters.get_stored_count(ACTIVE_GAMES_COUNTER),
+                       counters.get_stored_count(ACTIVE_ATTEMPTS_COUNTER))
+    _add_games_task(job)
+
+
+def _confirmed(previous, drift):
+    """Returns the part of a drift that the run before found too"""
+    if previous * drift <= 0:
+        return 0
+    return min(previous, drift, key=abs)
+
+
+@ndb.transactional_tasklet(xg=True)
+def _advance_games(batch, cursor, count, total):
+    """Adds the recount of a batch to the job and moves it to the next batch,
+    ending the run after the last one. Returns the job, or None if the batch
+    was already counted."""
+    job = yield ActiveGamesJob.get_by_id_async('active_games')
+    if job is None or job.started is None or job.batch != batch:
+        raise ndb.Return(None)
+    job.count += count
+    job.total += total
+    job.cursor = cursor
+    job.batch += 1
+    if cursor is None:
+        drift = (job.count - job.base_count, job.total - job.base_total)
+        games = _confirmed(job.drift_count, drift[0])
+        attempts = _confirmed(job.drift_total, drift[1])
+        if drift != (0, 0):
+            logging.warning('Recounted %d active games with %d attempts, '
+                            '%+d games and %+d attempts from the totals, '
+                            'correcting %+d games and %+d attempts',
+                            job.count, job.total, drift[0], drift[1], games,
+                            attempts)
+        job.drift_count = drift[0] - games
+        job.drift_total = drift[1] - attempts
+        job.started = None
+        yield job.put_async(), track_active_games_async(games, attempts)
+    else:
+        yield job.put_async()
+    raise ndb.Return(job)
+
+
+def recount_games_batch(batch):
+    """Recounts a batch of the active games of the current run and queues
+    the next batch. Tasks of other batches are left alone."""
+    job = ActiveGamesJob.get_by_id('active_games')
+    if job is None or job.started is None:
+        return
+    if job.batch != batch:
+        # Make sure the current batch is queued, in case this task counted
+        # its batch but failed to queue the next one
+        _add_games_task(job)
+        return
+    # Games are scanned in key order and read again by key, as a game's
+    # attempts remaining changes while it is played
+    keys, cursor = next_batch(Game.query(Game.game_over == False),
+                              job.cursor, GAMES_BATCH_SIZE, keys_only=True)
+    games = [game for game in ndb.get_multi(keys)
+             if game and not game.game_over]
+    job = _advance_games(batch, cursor, len(games),
+                         sum(game.attempts_remaining for game in games)
+                         ).get_result()
+    if job is None:
+        return
+    if job.started is not None:
+        _add_games_task(job)
+    else:
+        counters.uncache(ACTIVE_GAMES_COUNTER)
+        counters.uncache(ACTIVE_ATTEMPTS_COUNTER)
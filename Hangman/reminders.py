@@ -0,0 +1,133 @@
+"""reminders.py - Pipeline sending reminder emails to users with active games.
+
+A run is a chain of scan tasks, each reading one batch of active game keys.
+Game keys sort by their parent User key, so all the games of a user are next
+to each other and users are deduplicated by remembering only the last user
+seen. Each batch fans the users it found out to send tasks, which fetch the
+users with a single get_multi and mail them.
+
+Every scan saves its cursor on the ReminderRun of the day, so a run that
+stopped can be resumed. Tasks are named after the run and batch, so a retried
+scan does not queue the same emails twice. Resuming a run starts a new
+attempt, and scan tasks are named after their attempt too, since the task of
+the batch a run stopped at may already have been used and task names can't
+be reused for days. Only the scans of the latest attempt go on."""
+
+import logging
+from datetime import date
+
+from google.appengine.api import app_identity, mail
+from google.appengine.ext import ndb
+
+from models import Game
+from utils import add_named_task, next_batch
+
+SCAN_BATCH_SIZE = 500
+SEND_BATCH_SIZE = 50
+QUEUE_URL = '/tasks/reminders'
+
+
+class ReminderRun(ndb.Model):
+    """Progress of the reminder run of a day, keyed by its date"""
+    cursor = ndb.StringProperty(indexed=False)
+    last_user = ndb.KeyProperty(kind='User', indexed=False)
+    batches = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    users = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    done = ndb.BooleanProperty(required=True, default=False, indexed=False)
+    attempt = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+
+def _add_scan_task(run_id, run):
+    add_named_task('reminder-{}-{}-scan-{}'.format(run_id, run.attempt,
+                                                   run.batches),
+                   QUEUE_URL + '/scan',
+                   {'run': run_id, 'attempt': run.attempt})
+
+
+@ndb.transactional
+def _start(run_id):
+    run = ReminderRun.get_by_id(run_id)
+    if run is None:
+        run = ReminderRun(id=run_id)
+    elif not run.done:
+        run.attempt += 1
+    else:
+        return run
+    run.put()
+    return run
+
+
+def start(day=None):
+    """Starts the reminder run of a day, or resumes it from its last
+    checkpoint in a new attempt if it was started before and did not
+    finish"""
+    run_id = (day or date.today()).isoformat()
+    run = _start(run_id)
+    if not run.done:
+        _add_scan_task(run_id, run)
+
+
+@ndb.transactional
+def _advance(run_id, attempt, batch, cursor, last_user, users):
+    """Saves the progress of a scan, unless another scan saved its batch
+    first. Returns the run, or None if the scan is outdated."""
+    run = ReminderRun.get_by_id(run_id)
+    if run.attempt != attempt or run.batches != batch:
+        return None
+    run.cursor = cursor
+    run.last_user = last_user
+    run.users += users
+    run.batches += 1
+    run.done = cursor is None
+    run.put()
+    return run
+
+
+def scan(run_id, attempt=0):
+    """Scans the next batch of active games of a run and queues the emails of
+    their users. Scans of an earlier attempt of the run do nothing."""
+    run = ReminderRun.get_by_id(run_id)
+    if run is None or run.done or run.attempt != attempt:
+        return
+    query = Game.query(Game.game_over == False).order(Game.key)
+    keys, cursor = next_batch(query, run.cursor, SCAN_BATCH_SIZE,
+                              keys_only=True)
+
+    user_keys = []
+    last_user = run.last_user
+    for key in keys:
+        if key.parent() != last_user:
+            last_user = key.parent()
+            user_keys.append(last_user)
+
+    for start in range(0, len(user_keys), SEND_BATCH_SIZE):
+        chunk = user_keys[start:start + SEND_BATCH_SIZE]
+        add_named_task(
+            'reminder-{}-send-{}-{}'.format(run_id, run.batches, start),
+            QUEUE_URL + '/send',
+            {'users': ','.join(key.urlsafe() for key in chunk)})
+
+    run = _advance(run_id, attempt, run.batches, cursor, last_user,
+                   len(user_keys))
+    if run is None:
+        return
+    if run.done:
+        logging.info('Reminder run %s queued emails for %d users', run_id,
+                     run.users)
+    else:
+        _add_scan_task(run_id, run)
+
+
+def send(urlsafe_user_keys):
+    """Sends a reminder email to each of a batch of users with an email"""
+    sender = 'noreply@{}.appspotmail.com'.format(
+        app_identity.get_application_id())
+    keys = [ndb.Key(urlsafe=key) for key in urlsafe_user_keys.split(',')]
+    for user in ndb.get_multi(keys):
+        if user and user.email:
+            subject = 'This is a reminder!'
+            body = 'Hello {}, come back and finish playing ' \
+                   'Hangman!'.format(user.name)
+            # This will send test emails, the arguments to send_mail are:
+            # from, to, subject, body
+            mail.send_mail(sender, user.email, subject, body)
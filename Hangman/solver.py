@@ -0,0 +1,203 @@
+"""solver.py - Guessing strategies that play Hangman against the game engine.
+
+A strategy is built from the words targets are drawn from. Its start(length)
+returns a Player for one game, which only sees what a player of the API
+would: the length of the target, the letters revealed so far and the wrong
+guesses. Player.guess() returns the next letter to guess and Player.update()
+tells it the game after the guess.
+
+STRATEGIES holds the strategies by name:
+ - fixed: guesses letters from the most to the least common, whatever the
+ game reveals. This is the player words.difficulties ranks words with.
+ - frequency: guesses the letter held by the most words still consistent
+ with the game.
+ - entropy: guesses the letter whose outcome splits the words still
+ consistent with the game into the most even groups, i.e. the letter telling
+ the most about the target.
+
+Every game of a length starts with the same words, so games in the same
+state have the same words left and make the same choice. A strategy
+remembers the words and choice of each state it has seen, so only the first
+game reaching a state filters its words and chooses a letter."""
+
+import collections
+import itertools
+import math
+import re
+
+import engine
+
+# Game states remembered by a strategy before they are dropped
+STATE_CACHE_SIZE = 200000
+
+# Translation tables keeping one letter, and line breaks, and masking the rest
+_MASKS = dict((letter, ''.join(char if char in (letter, '\n') else '-'
+                               for char in map(chr, range(256))))
+              for letter in engine.LETTERS)
+# Matches running from a letter to the end of its line
+_TO_LINE_END = dict((letter, re.compile(letter + '.*'))
+                    for letter in engine.LETTERS)
+
+
+class Player(object):
+    """The state of one game as a player sees it, and the words still
+    consistent with it"""
+
+    def __init__(self, strategy, length):
+        self._strategy = strategy
+        self.obscured_target = engine.HIDDEN * length
+        self.wrong = ''
+        self.guessed = frozenset()
+        self._state = strategy.state(self.obscured_target, self.wrong, None)
+
+    @property
+    def words(self):
+        return self._state[0]
+
+    def guess(self):
+        """Returns the next letter to guess"""
+        if self._state[1] is None:
+            self._state[1] = self._strategy.choose(self)
+        return self._state[1]
+
+    def update(self, letter, obscured_target):
+        """Takes in the game after guessing letter"""
+        if obscured_target == self.obscured_target:
+            self.wrong = ''.join(sorted(self.wrong + letter))
+        self.obscured_target = obscured_target
+        self.guessed = self.guessed | frozenset(letter)
+        self._state = self._strategy.state(obscured_target, self.wrong,
+                                           (self.words, letter))
+
+
+class Strategy(object):
+    """Base class of the strategies. Subclasses set name and implement
+    choose, and set uses_words to False if they don't look at the words of
+    the player."""
+    name = None
+    uses_words = True
+
+    def __init__(self, words):
+        self._by_length = {}
+        for word in set(word.lower() for word in words if word.isalpha()):
+            self._by_length.setdefault(len(word), []).append(word)
+        frequency = collections.Counter()
+        for length_words in self._by_length.itervalues():
+            for word in length_words:
+                frequency.update(set(word))
+        # Every letter, from the most to the least common
+        self.ranked = sorted(engine.LETTERS,
+                             key=lambda letter: -frequency[letter])
+        self._rank = dict((letter, i) for i, letter in enumerate(self.ranked))
+        self._states = {}
+
+    def start(self, length):
+        """Returns the Player of a new game with a target of length letters"""
+        return Player(self, length)
+
+    def state(self, obscured_target, wrong, previous=None):
+        """Returns the words consistent with a game state and the letter to
+        guess in it, or None if not chosen yet. previous is the words of the
+        state before and the letter guessed since, None for a new game."""
+        key = (obscured_target, wrong)
+        state = self._states.get(key)
+        if state is None:
+            if previous is None:
+                words = self._by_length.get(len(obscured_target), [])
+            elif self.uses_words:
+                # Words holding the letter at the positions revealed, and
+                # nowhere else, look the same as the game once masked
+                words, letter = previous
+                mask = _MASKS[letter]
+                revealed = obscured_target.translate(mask)
+                words = [word for word in words
+                         if word.translate(mask) == revealed]
+            else:
+                words = []
+            if len(self._states) >= STATE_CACHE_SIZE:
+                self._states.clear()
+            state = self._states[key] = [words, None]
+        return state
+
+    def choose(self, player):
+        """Returns the letter to guess, never one already guessed"""
+        raise NotImplementedError
+
+    def most_common(self, player):
+        """Returns the most common letter not guessed yet"""
+        for letter in self.ranked:
+            if letter not in player.guessed:
+                return letter
+
+    def letter_counts(self, player):
+        """Returns the number of words of a player holding each letter not
+        guessed yet, leaving out letters none of them hold"""
+        lines = '\n'.join(player.words)
+        counts = {}
+        for letter in engine.LETTERS:
+            if letter not in player.guessed:
+                found = len(_TO_LINE_END[letter].findall(lines))
+                if found:
+                    counts[letter] = found
+        return counts
+
+
+class FixedStrategy(Strategy):
+    name = 'fixed'
+    uses_words = False
+
+    def choose(self, player):
+        return self.most_common(player)
+
+
+class FrequencyStrategy(Strategy):
+    name = 'frequency'
+
+    def choose(self, player):
+        counts = self.letter_counts(player)
+        if not counts:
+            return self.most_common(player)
+        return min(counts, key=lambda letter: (-counts[letter],
+                                               self._rank[letter]))
+
+
+class EntropyStrategy(Strategy):
+    name = 'entropy'
+
+    def choose(self, player):
+        words = player.words
+        lines = '\n'.join(words)
+        best, best_key = None, None
+        for letter, found in self.letter_counts(player).iteritems():
+            # Words with the letter at the same positions give the same
+            # outcome, and have the same pattern once the other letters are
+            # masked
+            patterns = sorted(lines.translate(_MASKS[letter]).split('\n'))
+            sizes = [len(list(group)) for _, group in
+                     itertools.groupby(patterns)]
+            # The entropy of the outcome is log(n) - sum(s * log(s)) / n
+            spread = sum(size * math.log(size) for size in sizes)
+            key = (spread, -found, self._rank[letter])
+            if best_key is None or key < best_key:
+                best, best_key = letter, key
+        return best or self.most_common(player)
+
+
+STRATEGIES = dict((strategy.name, strategy) for strategy in
+                  (FixedStrategy, FrequencyStrategy, EntropyStrategy))
+
+
+def play(strategy, target, attempts=engine.DEFAULT_ATTEMPTS):
+    """Plays a game with a strategy. Returns whether it was won, its score and
+    the number of guesses made."""
+    state = engine.Engine(target, attempts)
+    player = strategy.start(len(target))
+    guesses = 0
+    outcome = None
+    while not state.game_over:
+        letter = player.guess()
+        outcome = state.guess(letter)
+        player.update(letter, state.obscured_target)
+        guesses += 1
+    won = outcome == engine.WON
+    return won, engine.score(target, won, state.attempts_remaining), guesses
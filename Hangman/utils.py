@@ -1,22 +1,22 @@
 """utils.py - File for collecting general utility functions."""
 
 import logging
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 import endpoints
 
-def get_by_urlsafe(urlsafe, model):
-    """Returns an ndb.Model entity that the urlsafe key points to. Checks
-        that the type of entity returned is of the correct kind. Raises an
-        error if the key String is malformed or the entity is of the incorrect
-        kind
+def get_key_by_urlsafe(urlsafe, model):
+    """Returns the ndb.Key that a urlsafe key string encodes. Checks that the
+        key is of the correct kind.
     Args:
         urlsafe: A urlsafe key string
         model: The expected entity kind
     Returns:
-        The entity that the urlsafe Key string points to or None if no entity
-        exists.
+        The Key that the urlsafe Key string encodes.
     Raises:
-        ValueError:"""
+        BadRequestException: If the key String is malformed
+        ValueError: If the key is of the incorrect kind"""
     try:
         key = ndb.Key(urlsafe=urlsafe)
     except TypeError:
@@ -27,9 +27,41 @@ def get_by_urlsafe(urlsafe, model):
         else:
             raise
 
-    entity = key.get()
-    if not entity:
-        return None
-    if not isinstance(entity, model):
+    if key.kind() != model._get_kind():
         raise ValueError('Incorrect Kind')
-    return entity
+    return key
+
+
+def get_by_urlsafe(urlsafe, model):
+    """Returns an ndb.Model entity that the urlsafe key points to. Checks
+        that the type of entity returned is of the correct kind. Raises an
+        error if the key String is malformed or the entity is of the incorrect
+        kind
+    Args:
+        urlsafe: A urlsafe key string
+        model: The expected entity kind
+    Returns:
+        The entity that the urlsafe Key string points to or None if no entity
+        exists.
+    Raises:
+        ValueError:"""
+    return get_key_by_urlsafe(urlsafe, model).get()
+
+
+def next_batch(query, cursor, batch_size, **options):
+    """Returns a page of results of a query starting at a urlsafe cursor, and
+    the urlsafe cursor of the next page, or None if this was the last page.
+    Options such as projection or keys_only are passed on to fetch_page."""
+    start_cursor = Cursor(urlsafe=cursor) if cursor else None
+    results, next_cursor, more = query.fetch_page(
+        batch_size, start_cursor=start_cursor, **options)
+    return results, next_cursor.urlsafe() if more and next_cursor else None
+
+
+def add_named_task(name, url, params=None):
+    """Queues a named task, ignoring it if it was already queued, so a
+    retried task queues the next one only once"""
+    try:
+        taskqueue.add(name=name, url=url, params=params)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
@@ -0,0 +1,262 @@
+"""words.py - Word dictionaries used to pick the target word of new games.
+
+A dictionary is stored as one compact buffer: a small header followed by its
+words ordered by difficulty tier and then by length, with no separators.
+Since every word in a length bucket has the same size, the header's offsets
+are enough to find any word, and picking a random word of a tier in a
+min..max length range is a constant time draw instead of a dictionary scan.
+
+Tiers are worked out when the buffer is packed. A word's difficulty is the
+number of wrong guesses made by a player guessing letters from the most to
+the least common (the share of the dictionary's words holding the letter)
+before finding all of its letters. Words are ranked by difficulty, fewer
+distinct letters ranking as harder, and split into DIFFICULTIES tiers of
+equal size.
+
+Dictionaries are loaded lazily on first use, by memory-mapping the prebuilt
+index files under dictionaries/, which are checked in. Run `python words.py`
+to rebuild them after changing a word list or the packing. If an index file
+is missing or out of date, the buffer is built in memory from the source word
+list instead, which takes seconds and hundreds of MB on every instance."""
+
+import logging
+import os
+import random
+import string
+import struct
+import threading
+
+try:
+    import mmap
+except ImportError:
+    # Not available in every sandbox, fall back to reading the whole file
+    mmap = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.path.join(BASE_DIR, 'dictionaries')
+
+DEFAULT_DICTIONARY = 'full'
+
+# Named dictionaries: name -> (source word list, filter applied to each word)
+DICTIONARIES = {
+    # Every entry of the word list, proper nouns included
+    'full': ('words.txt', None),
+    # Only entries that are already lower case, i.e. no proper nouns
+    'standard': ('words.txt', lambda word: word.islower()),
+}
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+MAGIC = 'HMW2'
+HEADER = struct.Struct('<4sII')
+
+
+class NoWordsError(LookupError):
+    """Raised when no word matches the requested length range"""
+
+
+class UnknownDictionaryError(LookupError):
+    """Raised when a dictionary name is not in DICTIONARIES"""
+
+
+class UnknownDifficultyError(LookupError):
+    """Raised when a difficulty is not in DIFFICULTIES"""
+
+
+class WordIndex(object):
+    """Read-only view over a packed dictionary buffer.
+
+    The header holds the magic string, the maximum word length L and the
+    number of tiers T, followed by two tables of T * (L + 2) unsigned ints,
+    one row per tier: _counts[t][n] is the number of words before the tier t
+    words of n letters and _starts[t][n] is the byte offset of the first of
+    them in the data section. All words of a tier and length sit next to each
+    other, so a min..max range of a tier is one contiguous run of words."""
+
+    def __init__(self, buf):
+        magic, self.max_length, tiers = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a packed word dictionary')
+        size = self.max_length + 2
+        table = struct.unpack_from('<%dI' % (2 * tiers * size), buf,
+                                   HEADER.size)
+        self._counts = [table[t * size:(t + 1) * size] for t in range(tiers)]
+        table = table[tiers * size:]
+        self._starts = [table[t * size:(t + 1) * size] for t in range(tiers)]
+        self._data = HEADER.size + 4 * 2 * tiers * size
+        self._buf = buf
+
+    def __len__(self):
+        return self._counts[-1][-1]
+
+    def count(self, min, max, difficulty=None):
+        """Returns the number of words between min and max letters long, of
+        a difficulty or of any difficulty if it is None"""
+        return sum(end - start for start, end in
+                   self._ranges(min, max, difficulty))
+
+    def random_word(self, min, max, difficulty=None):
+        """Returns a random lower case word between min and max letters long,
+        of a difficulty or of any difficulty if it is None. Raises
+        NoWordsError if no such word exists."""
+        ranges = self._ranges(min, max, difficulty)
+        i = random.randrange(sum(end - start for start, end in ranges) or 1)
+        for start, end in ranges:
+            if i < end - start:
+                return self.word(start + i).lower()
+            i -= end - start
+        raise NoWordsError('No words between {} and {} letters long'
+                           .format(min, max))
+
+    def words(self, min, max, difficulty=None):
+        """Yields the lower case words between min and max letters long, of
+        a difficulty or of any difficulty if it is None"""
+        for start, end in self._ranges(min, max, difficulty):
+            for i in xrange(start, end):
+                yield self.word(i).lower()
+
+    def word(self, i):
+        """Returns the i-th word, words being ordered by tier and length"""
+        tier = 0
+        while self._counts[tier][-1] <= i:
+            tier += 1
+        counts = self._counts[tier]
+        length = 0
+        while counts[length + 1] <= i:
+            length += 1
+        offset = (self._data + self._starts[tier][length] +
+                  (i - counts[length]) * length)
+        return self._buf[offset:offset + length]
+
+    def _ranges(self, min, max, difficulty):
+        """Returns the ranges of word numbers with length min..max in each
+        tier of a difficulty, or of every tier if it is None"""
+        if difficulty is None:
+            tiers = self._counts
+        elif difficulty in DIFFICULTIES:
+            tiers = [self._counts[DIFFICULTIES.index(difficulty)]]
+        else:
+            raise UnknownDifficultyError(
+                'No difficulty named {}'.format(difficulty))
+        min = _clamp(min, 0, self.max_length + 1)
+        max = _clamp(max, min - 1, self.max_length)
+        return [(counts[min], counts[max + 1]) for counts in tiers]
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+def difficulties(words):
+    """Returns the difficulty of each word, as the number of wrong guesses
+    made guessing letters from the most to the least common"""
+    letter_sets = [frozenset(word.lower()) for word in words]
+    frequency = dict((letter, 0) for letter in string.ascii_lowercase)
+    for letters in letter_sets:
+        for letter in letters:
+            frequency[letter] += 1
+    ranked = sorted(frequency, key=frequency.get, reverse=True)
+    rank = dict((letter, i) for i, letter in enumerate(ranked))
+    # Guessing up to the word's least common letter finds all of its letters,
+    # every other letter guessed on the way is a miss
+    return [(max(rank[letter] for letter in letters) + 1 - len(letters),
+             -len(letters)) for letters in letter_sets]
+
+
+def pack(words):
+    """Returns the packed buffer for a WordIndex holding words"""
+    # Words with hyphens or other symbols can never be fully guessed
+    words = [word for word in words if word.isalpha()]
+    scores = difficulties(words)
+    order = sorted(range(len(words)), key=scores.__getitem__)
+    tiers = len(DIFFICULTIES)
+    max_length = max(len(word) for word in words) if words else 0
+
+    counts = []
+    starts = []
+    data = []
+    for tier in range(tiers):
+        buckets = {}
+        for i in order[len(order) * tier // tiers:
+                       len(order) * (tier + 1) // tiers]:
+            buckets.setdefault(len(words[i]), []).append(words[i])
+        tier_counts = [len(data)]
+        tier_starts = [sum(len(word) for word in data)]
+        for length in range(max_length + 1):
+            bucket = buckets.get(length, [])
+            data.extend(bucket)
+            tier_counts.append(tier_counts[-1] + len(bucket))
+            tier_starts.append(tier_starts[-1] + len(bucket) * length)
+        counts.extend(tier_counts)
+        starts.extend(tier_starts)
+    table = struct.pack('<%dI' % (len(counts) + len(starts)),
+                        *(counts + starts))
+    return HEADER.pack(MAGIC, max_length, tiers) + table + ''.join(data)
+
+
+def read_words(name):
+    """Returns the filtered source words of a named dictionary"""
+    source, word_filter = DICTIONARIES[name]
+    with open(os.path.join(BASE_DIR, source)) as words_file:
+        words = words_file.read().splitlines()
+    if word_filter is not None:
+        words = [word for word in words if word_filter(word)]
+    return words
+
+
+def index_path(name):
+    return os.path.join(INDEX_DIR, name + '.idx')
+
+
+def load(name):
+    """Returns a WordIndex for a named dictionary, memory-mapping its prebuilt
+    index file when there is one"""
+    if name not in DICTIONARIES:
+        raise UnknownDictionaryError('No dictionary named {}'.format(name))
+    path = index_path(name)
+    if os.path.exists(path):
+        with open(path, 'rb') as index_file:
+            if mmap is not None:
+                buf = mmap.mmap(index_file.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+            else:
+                buf = index_file.read()
+        try:
+            return WordIndex(buf)
+        except ValueError:
+            logging.error('%s is out of date, building the dictionary in '
+                          'memory. Run words.py to rebuild it.', path)
+    else:
+        logging.error('%s is missing, building the dictionary in memory. Run '
+                      'words.py to build it.', path)
+    return WordIndex(pack(read_words(name)))
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def get(name=DEFAULT_DICTIONARY):
+    """Returns the WordIndex for a named dictionary, loading it on first use.
+    Raises UnknownDictionaryError for names not in DICTIONARIES."""
+    index = _loaded.get(name)
+    if index is None:
+        with _lock:
+            index = _loaded.get(name)
+            if index is None:
+                index = _loaded[name] = load(name)
+    return index
+
+
+def build_all():
+    """Writes the index file of every named dictionary"""
+    if not os.path.isdir(INDEX_DIR):
+        os.makedirs(INDEX_DIR)
+    for name in sorted(DICTIONARIES):
+        with open(index_path(name), 'wb') as index_file:
+            index_file.write(pack(read_words(name)))
+        print('Built {}'.format(index_path(name)))
+
+
+if __name__ == '__main__':
+    build_all()
@@ -0,0 +1,243 @@
+"""bench_api.py - Load test of the HangmanApi endpoints, run in-process
+against the App Engine testbed stubs (datastore, memcache, taskqueue and
+mail), so it needs no network or dev_appserver.
+
+Simulated players create games, guess letters, and read games, scores and
+leaderboards in a weighted mix. Queued tasks are run between batches of
+requests. For every endpoint the report gives calls, throughput, p50/p99
+latency and datastore RPCs per call.
+
+Save a run with --save and compare later runs against it with --baseline
+to catch regressions before deploying: the run fails if an endpoint's p50
+grows by more than --tolerance or it makes more datastore RPCs per call.
+
+Usage: python benchmarks/bench_api.py [--users N] [--requests N] [--seed N]
+           [--save FILE] [--baseline FILE] [--tolerance 0.25]"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import gae
+
+gae.setup_paths()
+
+import endpoints
+from protorpc import message_types
+
+import api
+import engine
+import main as tasks_app
+import models
+import ratelimit
+
+# Relative weight of each action in the simulated mix
+MIX = [
+    ('make_move', 50),
+    ('get_game', 12),
+    ('new_game', 8),
+    ('get_user_games', 6),
+    ('get_game_history', 5),
+    ('get_high_scores', 5),
+    ('get_user_rankings', 4),
+    ('get_user_scores', 4),
+    ('get_scores', 3),
+    ('get_average_attempts', 2),
+    ('cancel_game', 1),
+]
+TASK_EVERY = 50
+
+
+def request(endpoint, **fields):
+    """Builds the request message of an endpoint"""
+    method = getattr(api.HangmanApi, endpoint)
+    request_type = method.remote.request_type
+    if request_type is message_types.VoidMessage:
+        return request_type()
+    return request_type(**fields)
+
+
+class Player(object):
+    def __init__(self, name):
+        self.name = name
+        self.games = []
+
+
+class Simulation(object):
+    def __init__(self, bed, users, seed):
+        self.bed = bed
+        self.random = random.Random(seed)
+        self.service = api.HangmanApi()
+        self.players = [Player('player{}'.format(i)) for i in range(users)]
+        self.rpcs = gae.RpcCounter().install()
+        self.stats = {}
+        # Simulated players are far faster than people, check the limits
+        # without ever throttling them
+        ratelimit.LIMITS = dict((scope, (float('inf'), float('inf')))
+                                for scope in ratelimit.LIMITS)
+
+    def call(self, endpoint, **fields):
+        """Calls an endpoint, recording its latency and RPCs. Returns the
+        response, or None if the endpoint raised a ServiceException."""
+        message = request(endpoint, **fields)
+        self.rpcs.reset()
+        start = time.time()
+        try:
+            response = getattr(self.service, endpoint)(message)
+        except endpoints.ServiceException:
+            response = None
+        elapsed = time.time() - start
+        rpcs = self.rpcs.reset()
+        stats = self.stats.setdefault(endpoint, {'latency': [], 'rpcs': {}})
+        stats['latency'].append(elapsed)
+        for (service, call), count in rpcs.items():
+            if service == 'datastore_v3':
+                stats['rpcs'][call] = stats['rpcs'].get(call, 0) + count
+        return response
+
+    def setup(self):
+        # Every user is created with a name index entry, as on an app that
+        # ran the index_user_names migration
+        models.UserNameIndexComplete(id='users').put()
+        for player in self.players:
+            self.call('create_user', user_name=player.name)
+            self.new_game(player)
+
+    def new_game(self, player):
+        game = self.call('new_game', user_name=player.name, min=3, max=10)
+        if game:
+            player.games.append(game.urlsafe_key)
+
+    def active_game(self, player):
+        if not player.games:
+            self.new_game(player)
+        return player.games[-1] if player.games else None
+
+    def step(self, action):
+        player = self.random.choice(self.players)
+        if action == 'new_game':
+            self.new_game(player)
+        elif action == 'make_move':
+            key = self.active_game(player)
+            if key:
+                game = self.call('make_move', urlsafe_game_key=key,
+                                 guess=self.random.choice(engine.LETTERS))
+                if game and game.game_over:
+                    player.games.remove(key)
+        elif action in ('get_game', 'get_game_history'):
+            key = self.active_game(player)
+            if key:
+                self.call(action, urlsafe_game_key=key)
+        elif action == 'cancel_game':
+            key = self.active_game(player)
+            if key:
+                self.call('cancel_game', urlsafe_game_key=key)
+                player.games.remove(key)
+        elif action in ('get_user_games', 'get_user_scores'):
+            self.call(action, user_name=player.name)
+        elif action == 'get_high_scores':
+            self.call(action, number_of_results=10)
+        else:
+            self.call(action)
+
+    def run(self, requests):
+        actions = [name for name, weight in MIX for _ in range(weight)]
+        start = time.time()
+        for count in range(requests):
+            self.step(self.random.choice(actions))
+            if count % TASK_EVERY == 0:
+                gae.run_tasks(self.bed, tasks_app.app)
+        gae.run_tasks(self.bed, tasks_app.app)
+        return time.time() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(stats):
+    summary = {}
+    for endpoint, data in stats.items():
+        latency = data['latency']
+        calls = len(latency)
+        summary[endpoint] = {
+            'calls': calls,
+            'per_second': calls / sum(latency) if sum(latency) else 0,
+            'p50_ms': percentile(latency, 0.5) * 1000,
+            'p99_ms': percentile(latency, 0.99) * 1000,
+            'rpcs': dict((call, float(count) / calls)
+                         for call, count in data['rpcs'].items()),
+        }
+    return summary
+
+
+def report(summary, elapsed):
+    print('{:<24} {:>6} {:>9} {:>8} {:>8}  datastore RPCs per call'.format(
+        'endpoint', 'calls', 'calls/s', 'p50 ms', 'p99 ms'))
+    for endpoint in sorted(summary):
+        row = summary[endpoint]
+        rpcs = ' '.join('{}={:.1f}'.format(call, count)
+                        for call, count in sorted(row['rpcs'].items()))
+        print('{:<24} {calls:>6} {per_second:>9.0f} {p50_ms:>8.2f} '
+              '{p99_ms:>8.2f}  {rpcs}'.format(endpoint, rpcs=rpcs, **row))
+    print('Total wall time {:.1f} s'.format(elapsed))
+
+
+def regressions(summary, baseline, tolerance):
+    """Returns a description of each endpoint that got slower or makes more
+    datastore RPCs than in the baseline"""
+    found = []
+    for endpoint, old in sorted(baseline.items()):
+        new = summary.get(endpoint)
+        if new is None:
+            continue
+        if new['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            found.append('{}: p50 {:.2f} ms -> {:.2f} ms'.format(
+                endpoint, old['p50_ms'], new['p50_ms']))
+        old_rpcs = sum(old['rpcs'].values())
+        new_rpcs = sum(new['rpcs'].values())
+        if new_rpcs > old_rpcs + 0.05:
+            found.append('{}: {:.2f} -> {:.2f} datastore RPCs per call'
+                         .format(endpoint, old_rpcs, new_rpcs))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with saved results')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    bed = gae.activate()
+    try:
+        simulation = Simulation(bed, args.users, args.seed)
+        simulation.setup()
+        simulation.stats = {}
+        elapsed = simulation.run(args.requests)
+    finally:
+        bed.deactivate()
+
+    summary = summarize(simulation.stats)
+    report(summary, elapsed)
+    if args.save:
+        with open(args.save, 'w') as results:
+            json.dump(summary, results, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as results:
+            found = regressions(summary, json.load(results), args.tolerance)
+        for regression in found:
+            print('REGRESSION ' + regression)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""bench_dictionary.py - Measures the cold start time and memory of loading
+the word dictionary, comparing the original import time
+open('words.txt').read().splitlines() with the lazy packed dictionaries.
+
+Each case runs in a fresh interpreter so timings and peak RSS are not shared.
+
+Usage: python benchmarks/bench_dictionary.py"""
+
+import os
+import subprocess
+import sys
+
+HANGMAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'Hangman')
+
+CASES = [
+    ('word list (original)',
+     "WORDS = open('words.txt').read().splitlines()\n"
+     "random.choice([w for w in WORDS if 1 <= len(w) <= 10])"),
+    ('packed, built in memory',
+     "words.index_path = lambda name: '/nonexistent'\n"
+     "words.get('full').random_word(1, 10)"),
+    ('packed, memory-mapped',
+     "words.get('full').random_word(1, 10)"),
+]
+
+SCRIPT = """
+import random, resource, time
+import words
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+%s
+elapsed = time.time() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print('%%.1f %%d' %% (elapsed * 1000, peak - base))
+"""
+
+
+def run(code):
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % code],
+                                     cwd=HANGMAN_DIR)
+    elapsed, rss = output.split()
+    return float(elapsed), int(rss)
+
+
+def main():
+    sys.path.insert(0, HANGMAN_DIR)
+    import words
+    if not os.path.exists(words.index_path('full')):
+        print('Run `python words.py` in Hangman/ first to build the index '
+              'files, skipping the memory-mapped case.')
+        del CASES[-1]
+    for name, code in CASES:
+        elapsed, rss = run(code)
+        print('{:<26} first word: {:7.1f} ms  extra peak RSS: {:7d} KB'
+              .format(name, elapsed, rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""bench_engine.py - Replays simulated guesses through the game engine and
+through the original string based make_move logic.
+
+Every game draws a target from the dictionary and guesses random letters,
+repeats included, until it is won or lost. The 'engine (per request)' case
+rebuilds the engine from the guesses so far before every guess, which is
+what make_move does for each request.
+
+Usage: python benchmarks/bench_engine.py [games]"""
+
+import os
+import random
+import sys
+import time
+
+HANGMAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'Hangman')
+sys.path.insert(0, HANGMAN_DIR)
+
+import engine
+import words
+
+ATTEMPTS = 8
+
+
+def legacy_guess(game, guess):
+    """The make_move logic from before engine.py, on a dict of game fields"""
+    answer_as_list = list(game['target'])
+    hidden_answer_as_list = list(game['obscured_target'])
+    if game['game_over']:
+        return engine.GAME_OVER
+    if len(guess) != 1:
+        return engine.NOT_ONE_LETTER
+    if not guess.isalpha():
+        return engine.NOT_A_LETTER
+    guess = guess.lower()
+    if guess in game['target'] and guess not in game['obscured_target']:
+        for index in range(len(answer_as_list)):
+            if answer_as_list[index] == guess:
+                hidden_answer_as_list[index] = guess
+                if guess not in game['correct_letters']:
+                    game['correct_letters'] = game['correct_letters'] + guess
+        game['obscured_target'] = ''.join(hidden_answer_as_list)
+        game['all_guesses'] = game['all_guesses'] + guess
+        if '$' not in game['obscured_target']:
+            game['game_over'] = True
+            return engine.WON
+        return engine.CORRECT
+    elif guess in game['obscured_target']:
+        return engine.ALREADY_FOUND
+    elif guess in game['tried_letters_were_wrong']:
+        return engine.ALREADY_TRIED
+    game['all_guesses'] = game['all_guesses'] + guess
+    game['tried_letters_were_wrong'] = game['tried_letters_were_wrong'] + guess
+    game['attempts_remaining'] -= 1
+    if game['attempts_remaining'] < 1:
+        game['game_over'] = True
+        return engine.LOST
+    return engine.WRONG
+
+
+def new_legacy_game(target):
+    return {'target': target, 'obscured_target': '$' * len(target),
+            'attempts_remaining': ATTEMPTS, 'game_over': False,
+            'correct_letters': '', 'tried_letters_were_wrong': '',
+            'all_guesses': ''}
+
+
+def replay(games, play):
+    """Plays every (target, guesses) game, returns guesses made and outcomes"""
+    count = 0
+    outcomes = []
+    for target, guesses in games:
+        guess = play(target)
+        for letter in guesses:
+            count += 1
+            outcome = guess(letter)
+            if outcome in (engine.WON, engine.LOST):
+                break
+        outcomes.append(outcome)
+    return count, outcomes
+
+
+def play_legacy(target):
+    game = new_legacy_game(target)
+    return lambda letter: legacy_guess(game, letter)
+
+
+def play_engine(target):
+    return engine.Engine(target, ATTEMPTS).guess
+
+
+def play_engine_per_request(target):
+    game = {'attempts_remaining': ATTEMPTS, 'all_guesses': '',
+            'obscured_target': engine.HIDDEN * len(target)}
+
+    def guess(letter):
+        state = engine.Engine(target, game['attempts_remaining'],
+                              game['all_guesses'], game['obscured_target'])
+        outcome = state.guess(letter)
+        if outcome in engine.ACCEPTED:
+            game['all_guesses'] += letter
+            game['attempts_remaining'] = state.attempts_remaining
+            game['obscured_target'] = state.obscured_target
+        return outcome
+    return guess
+
+
+def main(game_count):
+    index = words.get('full')
+    games = []
+    for _ in range(game_count):
+        target = index.random_word(1, 24)
+        # Enough random letters, with repeats, to always finish the game
+        guesses = [random.choice(engine.LETTERS) for _ in range(80)]
+        games.append((target, guesses))
+
+    results = {}
+    for name, play in (('legacy', play_legacy), ('engine', play_engine),
+                       ('engine (per request)', play_engine_per_request)):
+        start = time.time()
+        count, outcomes = replay(games, play)
+        elapsed = time.time() - start
+        results[name] = outcomes
+        print('{:<20} {:>9} guesses in {:6.2f} s  {:8.0f} guesses/s'.format(
+            name, count, elapsed, count / elapsed))
+    for name in results:
+        assert results[name] == results['legacy'], 'Outcomes differ'
+    print('Outcomes of {} games match'.format(len(games)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 150000)
@@ -0,0 +1,60 @@
+"""bench_new_games.py - Compares the cost per game of creating games one
+new_game call at a time with creating them with a single new_games call, in
+process against the testbed stubs.
+
+Usage: python benchmarks/bench_new_games.py [users] [rounds]"""
+
+import sys
+import time
+
+import gae
+
+gae.setup_paths()
+
+from bench_api import request
+
+import api
+
+
+def measure(rpcs, label, calls, games):
+    rpcs.reset()
+    start = time.time()
+    for call in calls:
+        call()
+    elapsed = time.time() - start
+    counts = rpcs.reset()
+    datastore = sum(count for (service, _), count in counts.items()
+                    if service == 'datastore_v3')
+    print('{:<10} {:8.3f} ms/game  {:6.2f} datastore RPCs/game  '
+          '{:6.2f} RPCs/game'.format(label, elapsed * 1000 / games,
+                                     float(datastore) / games,
+                                     float(sum(counts.values())) / games))
+    return elapsed / games
+
+
+def main(users, rounds):
+    bed = gae.activate()
+    try:
+        service = api.HangmanApi()
+        rpcs = gae.RpcCounter().install()
+        names = ['player{}'.format(i) for i in range(users)]
+        for name in names:
+            service.create_user(request('create_user', user_name=name))
+        games = users * rounds
+
+        single = measure(rpcs, 'new_game', [
+            lambda name=name: service.new_game(request(
+                'new_game', user_name=name, min=3, max=10))
+            for _ in range(rounds) for name in names], games)
+        bulk = measure(rpcs, 'new_games', [
+            lambda: service.new_games(request(
+                'new_games', user_names=names, rounds=rounds, min=3,
+                max=10))], games)
+        print('new_games is {:.1f}x cheaper per game'.format(single / bulk))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,52 @@
+"""bench_words.py - Compares picking a new game's word with the WordIndex
+against the original scan over every word in the dictionary.
+
+Usage: python benchmarks/bench_words.py [iterations]"""
+
+import os
+import random
+import sys
+import timeit
+
+HANGMAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'Hangman')
+sys.path.insert(0, HANGMAN_DIR)
+
+import words
+
+WORDS_PATH = os.path.join(HANGMAN_DIR, 'words.txt')
+RANGES = [(1, 10), (5, 5), (3, 8), (12, 24)]
+
+
+def scan_pick(all_words, min, max):
+    """The pre-index implementation of Game.new_game's word pick"""
+    acceptable_words = []
+    for word in all_words:
+        if len(word) >= min and len(word) <= max:
+            acceptable_words.append(word)
+    return random.choice(acceptable_words).lower()
+
+
+def main(iterations):
+    all_words = open(WORDS_PATH).read().splitlines()
+    build = timeit.timeit(lambda: words.pack(all_words), number=1)
+    index = words.WordIndex(words.pack(all_words))
+    print('index build: {:.1f} ms for {} words'.format(build * 1000,
+                                                        len(index)))
+    for min, max in RANGES:
+        scan = timeit.timeit(lambda: scan_pick(all_words, min, max),
+                             number=iterations) / iterations
+        indexed = timeit.timeit(lambda: index.random_word(min, max),
+                                number=iterations * 1000) / (iterations * 1000)
+        print('min={:<3} max={:<3} scan: {:9.1f} us  index: {:6.2f} us  '
+              '({:.0f}x)'.format(min, max, scan * 1e6, indexed * 1e6,
+                                 scan / indexed))
+    for difficulty in words.DIFFICULTIES:
+        indexed = timeit.timeit(lambda: index.random_word(1, 10, difficulty),
+                                number=iterations * 1000) / (iterations * 1000)
+        print('min=1   max=10  {:<6}  index: {:6.2f} us  ({} words)'.format(
+            difficulty, indexed * 1e6, index.count(1, 10, difficulty)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,84 @@
+"""compare_revisions.py - Runs bench_api.py on two git revisions with the same
+options and prints the p50 latency and datastore RPCs per call of every
+endpoint before and after.
+
+Each revision is checked out in a temporary git worktree, so the working tree
+is left alone. Without a second revision the working tree is the after run.
+
+Usage: python benchmarks/compare_revisions.py BASE [REVISION]
+           [-- bench_api.py options]
+e.g.   python benchmarks/compare_revisions.py HEAD~1 HEAD -- --requests 20000"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def run_bench(revision, options, scratch):
+    """Runs bench_api.py of a revision, or of the working tree if revision is
+    None, and returns its saved summary"""
+    run = len(os.listdir(scratch))
+    results = os.path.join(scratch, 'results-{}.json'.format(run))
+    tree = ROOT
+    if revision is not None:
+        tree = os.path.join(scratch, 'tree-{}'.format(run))
+        subprocess.check_call(['git', 'worktree', 'add', '--detach', tree,
+                               revision], cwd=ROOT)
+    try:
+        if subprocess.call(
+                [sys.executable, os.path.join('benchmarks', 'bench_api.py'),
+                 '--save', results] + options, cwd=tree):
+            sys.exit('bench_api.py failed on {}'.format(
+                revision or 'the working tree'))
+    finally:
+        if revision is not None:
+            subprocess.call(['git', 'worktree', 'remove', '--force', tree],
+                            cwd=ROOT)
+    with open(results) as saved:
+        return json.load(saved)
+
+
+def report(base, before, revision, after):
+    print('{:<24} {:>10} {:>10} {:>8} {:>8} {:>8}'.format(
+        'endpoint', 'p50 before', 'p50 after', 'change', 'RPCs', 'RPCs'))
+    for endpoint in sorted(set(before) | set(after)):
+        old, new = before.get(endpoint), after.get(endpoint)
+        if old is None or new is None:
+            print('{:<24} only in {}'.format(
+                endpoint, base if old else revision or 'working tree'))
+            continue
+        change = (new['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] \
+            else 0
+        print('{:<24} {:>10.2f} {:>10.2f} {:>+7.0f}% {:>8.2f} {:>8.2f}'.format(
+            endpoint, old['p50_ms'], new['p50_ms'], change,
+            sum(old['rpcs'].values()), sum(new['rpcs'].values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('base', help='revision to compare against')
+    parser.add_argument('revision', nargs='?',
+                        help='revision to measure, the working tree if '
+                             'not given')
+    parser.add_argument('options', nargs=argparse.REMAINDER,
+                        help='options passed on to bench_api.py, after --')
+    args = parser.parse_args()
+    options = [option for option in args.options if option != '--']
+
+    scratch = tempfile.mkdtemp(prefix='compare-revisions-')
+    try:
+        before = run_bench(args.base, options, scratch)
+        after = run_bench(args.revision, options, scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    report(args.base, before, args.revision, after)
+
+
+if __name__ == '__main__':
+    main()
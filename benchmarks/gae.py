@@ -0,0 +1,115 @@
+"""gae.py - Puts the App Engine SDK on sys.path and activates the testbed
+service stubs, so benchmarks run the app in-process with no network.
+
+The SDK is found from the GAE_SDK environment variable, or from the location
+of dev_appserver.py on the PATH."""
+
+import os
+import sys
+
+HANGMAN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           os.pardir, 'Hangman'))
+
+
+def find_sdk():
+    """Returns the directory of the App Engine Python SDK, or None if it
+    can't be found"""
+    sdk = os.environ.get('GAE_SDK')
+    if not sdk:
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            candidate = os.path.join(directory, 'dev_appserver.py')
+            if os.path.exists(candidate):
+                sdk = os.path.dirname(os.path.realpath(candidate))
+                break
+    if sdk:
+        # Cloud SDK installs keep the App Engine SDK under platform/
+        bundled = os.path.join(sdk, os.pardir, 'platform', 'google_appengine')
+        if os.path.isdir(bundled):
+            sdk = bundled
+    if not sdk or not os.path.exists(os.path.join(sdk, 'dev_appserver.py')):
+        return None
+    return os.path.abspath(sdk)
+
+
+def setup_paths():
+    """Makes the SDK, its bundled libraries and the app importable"""
+    sdk = find_sdk()
+    if sdk is None:
+        sys.exit('App Engine SDK not found. Set GAE_SDK to the directory '
+                 'holding dev_appserver.py.')
+    if sdk not in sys.path:
+        sys.path.insert(0, sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+    if HANGMAN_DIR not in sys.path:
+        sys.path.insert(0, HANGMAN_DIR)
+
+
+def activate():
+    """Activates a testbed with datastore, memcache, taskqueue and mail stubs
+    and returns it. Queries are strongly consistent."""
+    setup_paths()
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.setup_env(app_id='my-hangman-game', overwrite=True)
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+    bed.init_datastore_v3_stub(consistency_policy=policy,
+                               root_path=HANGMAN_DIR)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=HANGMAN_DIR)
+    bed.init_mail_stub()
+    bed.init_app_identity_stub()
+    ndb.get_context().clear_cache()
+    return bed
+
+
+class RpcCounter(object):
+    """Counts the RPCs made to App Engine services, by service and call,
+    e.g. ('datastore_v3', 'Put')"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def install(self):
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'rpc_counter', self._hook)
+        return self
+
+    def _hook(self, service, call, request, response, rpc=None):
+        self.counts[(service, call)] = self.counts.get((service, call), 0) + 1
+
+    def reset(self):
+        counts, self.counts = self.counts, {}
+        return counts
+
+
+def run_tasks(bed, app):
+    """Runs every queued task, and those they queue, against a WSGI app.
+    Returns the number of tasks run."""
+    import webapp2
+    from google.appengine.ext import testbed
+
+    stub = bed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+    ran = 0
+    while True:
+        tasks = [(queue['name'], task) for queue in stub.GetQueues()
+                 for task in stub.get_filtered_tasks(
+                     queue_names=[queue['name']])]
+        if not tasks:
+            return ran
+        for queue in stub.GetQueues():
+            stub.FlushQueue(queue['name'])
+        for queue_name, task in tasks:
+            request = webapp2.Request.blank(task.url, method=task.method,
+                                            body=task.payload or '')
+            request.headers['Content-Type'] = \
+                'application/x-www-form-urlencoded'
+            # Set by App Engine on task requests only
+            request.headers['X-AppEngine-QueueName'] = queue_name
+            request.get_response(app)
+            ran += 1
@@ -0,0 +1,232 @@
+"""simulate.py - Plays games of Hangman offline with the strategies of
+solver.py, against the game engine and scoring of the app.
+
+Reports the win rate and score distribution of each target length for every
+strategy, to see how the scoring and the number of attempts play out across
+a dictionary, and the games and guesses per second of the engine. Games are
+shared out across processes, one per core by default.
+
+With --games 0 every word of the dictionary is played once, otherwise that
+many targets are drawn the way new_game draws them. Use --save results.json
+once, then --baseline results.json to fail when games per second drop, or the
+win rate of a length moves, by more than the tolerances.
+
+Usage: python benchmarks/simulate.py [--strategy NAME] [--games N]
+           [--attempts N] [--min N] [--max N] [--difficulty D]
+           [--dictionary NAME] [--processes N] [--seed N]
+           [--save FILE] [--baseline FILE]"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+HANGMAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'Hangman')
+sys.path.insert(0, HANGMAN_DIR)
+
+import engine
+import solver
+import words
+
+CHUNK_SIZE = 2000
+
+# The strategy and targets, set by setup before the worker processes start
+_worker = {}
+
+
+def setup(args):
+    """Builds the strategy and the targets to play"""
+    index = words.get(args.dictionary)
+    _worker['strategy'] = solver.STRATEGIES[args.strategy](
+        index.words(0, index.max_length))
+    _worker['index'] = index
+    _worker['args'] = args
+    if not args.games:
+        _worker['targets'] = list(index.words(args.min, args.max,
+                                              args.difficulty))
+
+
+def play_chunk(chunk):
+    """Plays the games of a chunk. Returns the games, wins, guesses and
+    scores of each target length."""
+    number, start, stop = chunk
+    args = _worker['args']
+    if args.games:
+        random.seed((args.seed, number))
+        index = _worker['index']
+        targets = [index.random_word(args.min, args.max, args.difficulty)
+                   for _ in xrange(stop - start)]
+    else:
+        targets = _worker['targets'][start:stop]
+
+    strategy = _worker['strategy']
+    lengths = {}
+    for target in targets:
+        won, score, guesses = solver.play(strategy, target, args.attempts)
+        totals = lengths.get(len(target))
+        if totals is None:
+            totals = lengths[len(target)] = [0, 0, 0, collections.Counter()]
+        totals[0] += 1
+        totals[1] += won
+        totals[2] += guesses
+        totals[3][score] += 1
+    return lengths
+
+
+def percentile(scores, games, share):
+    """Returns the score reached by share of the games, from a Counter of
+    scores"""
+    rank = share * (games - 1)
+    seen = 0
+    for score in sorted(scores):
+        seen += scores[score]
+        if seen > rank:
+            return score
+
+
+def simulate(args):
+    """Plays the games of a strategy and returns their summary"""
+    if args.games:
+        games = args.games
+    else:
+        index = words.get(args.dictionary)
+        games = index.count(args.min, args.max, args.difficulty)
+    chunks = [(number, start, min(games, start + CHUNK_SIZE))
+              for number, start in enumerate(xrange(0, games, CHUNK_SIZE))]
+
+    # Set up before the workers are forked, so they share it
+    setup(args)
+    start = time.time()
+    if args.processes == 1:
+        results = [play_chunk(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        try:
+            results = list(pool.imap_unordered(play_chunk, chunks))
+        finally:
+            pool.terminate()
+    elapsed = time.time() - start
+
+    lengths = {}
+    for result in results:
+        for length, (played, won, guesses, scores) in result.iteritems():
+            totals = lengths.setdefault(length,
+                                        [0, 0, 0, collections.Counter()])
+            totals[0] += played
+            totals[1] += won
+            totals[2] += guesses
+            totals[3].update(scores)
+
+    summary = {'games': games, 'seconds': elapsed,
+               'games_per_second': games / elapsed,
+               'guesses_per_second': sum(totals[2] for totals in
+                                         lengths.itervalues()) / elapsed,
+               'lengths': {}}
+    for length, (played, won, guesses, scores) in sorted(lengths.items()):
+        summary['lengths'][str(length)] = {
+            'games': played,
+            'win_rate': float(won) / played,
+            'guesses': float(guesses) / played,
+            'mean_score': float(sum(score * count for score, count in
+                                    scores.iteritems())) / played,
+            'p10': percentile(scores, played, 0.1),
+            'p50': percentile(scores, played, 0.5),
+            'p90': percentile(scores, played, 0.9),
+            'scores': dict((str(score), count) for score, count in
+                           sorted(scores.items()))}
+    return summary
+
+
+def report(strategy, summary, processes):
+    print('{}: {} games in {:.1f} s, {:.0f} games/s, {:.0f} guesses/s, '
+          '{} processes'.format(strategy, summary['games'],
+                                summary['seconds'],
+                                summary['games_per_second'],
+                                summary['guesses_per_second'], processes))
+    print('{:>6} {:>8} {:>6} {:>8} {:>6} {:>5} {:>5} {:>5}'.format(
+        'length', 'games', 'won%', 'guesses', 'score', 'p10', 'p50', 'p90'))
+    for length, stats in sorted(summary['lengths'].items(),
+                                key=lambda item: int(item[0])):
+        print('{:>6} {:>8} {:>6.1f} {:>8.1f} {:>6.1f} {:>5} {:>5} {:>5}'
+              .format(length, stats['games'], stats['win_rate'] * 100,
+                      stats['guesses'], stats['mean_score'], stats['p10'],
+                      stats['p50'], stats['p90']))
+
+
+def regressions(strategy, summary, baseline, tolerance, win_rate_tolerance):
+    """Returns the changes from a baseline beyond the tolerances"""
+    found = []
+    old = baseline.get(strategy)
+    if old is None:
+        return found
+    if summary['games_per_second'] < (old['games_per_second'] *
+                                      (1 - tolerance)):
+        found.append('{}: {:.0f} games/s, was {:.0f}'.format(
+            strategy, summary['games_per_second'], old['games_per_second']))
+    for length, stats in sorted(summary['lengths'].items()):
+        old_stats = old['lengths'].get(length)
+        if old_stats and abs(stats['win_rate'] - old_stats['win_rate']) > (
+                win_rate_tolerance):
+            found.append('{}: length {} won {:.1f}%, was {:.1f}%'.format(
+                strategy, length, stats['win_rate'] * 100,
+                old_stats['win_rate'] * 100))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--strategy', action='append',
+                        choices=sorted(solver.STRATEGIES),
+                        help='repeat to run several, defaults to all')
+    parser.add_argument('--games', type=int, default=100000,
+                        help='0 plays every word of the dictionary once')
+    parser.add_argument('--attempts', type=int,
+                        default=engine.DEFAULT_ATTEMPTS)
+    parser.add_argument('--min', type=int, default=3)
+    parser.add_argument('--max', type=int, default=12)
+    parser.add_argument('--difficulty', choices=words.DIFFICULTIES)
+    parser.add_argument('--dictionary', default=words.DEFAULT_DICTIONARY,
+                        choices=sorted(words.DICTIONARIES))
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with saved results')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='share games/s may drop by')
+    parser.add_argument('--win-rate-tolerance', type=float, default=0.01,
+                        help='change in the win rate of a length allowed')
+    args = parser.parse_args()
+
+    strategies = args.strategy or sorted(solver.STRATEGIES)
+    results = {}
+    for strategy in strategies:
+        args.strategy = strategy
+        results[strategy] = simulate(args)
+        report(strategy, results[strategy], args.processes)
+        print('')
+
+    if args.save:
+        with open(args.save, 'w') as saved:
+            json.dump(results, saved, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as saved:
+            baseline = json.load(saved)
+        found = []
+        for strategy, summary in sorted(results.items()):
+            found.extend(regressions(strategy, summary, baseline,
+                                     args.tolerance,
+                                     args.win_rate_tolerance))
+        for regression in found:
+            print('REGRESSION ' + regression)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""stress_end_game.py - Ends many games of one user concurrently against the
+local datastore stub and checks that the user's totals, the Scores and the
+running totals of active games add up.
+
+The same run is repeated with the original end_game, which saved the game,
+the user and the score in three separate puts, to show the updates it loses.
+
+Usage: python benchmarks/stress_end_game.py [threads] [games_per_thread]"""
+
+import random
+import sys
+import threading
+import time
+from datetime import date
+
+import gae
+
+gae.setup_paths()
+
+from google.appengine.ext import ndb
+
+import counters
+from models import User, Game, Score, ACTIVE_GAMES_COUNTER, MAX_ACTIVE_GAMES
+
+
+def legacy_end_game(game, won):
+    """end_game as it was before it used a single transaction"""
+    game.game_over = True
+    game.put()
+    game_score = game.attempts_remaining * len(game.target) if won else 0
+    user = game.user.get()
+    user.total_game_score = user.total_game_score + game_score
+    user.total_games_played = user.total_games_played + 1
+    user.user_score = (user.total_game_score/user.total_games_played)
+    user.put()
+    Score(user=game.user, user_name=user.name, date=date.today(), won=won,
+          game_score=game_score).put()
+
+
+def run(end_game, threads, games_per_thread):
+    bed = gae.activate()
+    try:
+        user = User(name='stress')
+        user.put()
+        games = [Game.new_game(user, 3, 10)
+                 for _ in range(threads * games_per_thread)]
+        expected = {'score': 0, 'played': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def worker(keys):
+            ndb.get_context().set_cache_policy(False)
+            for key in keys:
+                game = key.get()
+                won = random.random() < 0.5
+                try:
+                    end_game(game, won)
+                except Exception:
+                    with lock:
+                        expected['failed'] += 1
+                    continue
+                with lock:
+                    expected['played'] += 1
+                    if won:
+                        expected['score'] += (game.attempts_remaining *
+                                              len(game.target))
+
+        keys = [game.key for game in games]
+        workers = [threading.Thread(target=worker,
+                                    args=(keys[i::threads],))
+                   for i in range(threads)]
+        start = time.time()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.time() - start
+
+        ndb.get_context().clear_cache()
+        user = user.key.get()
+        scores = Score.query(Score.user == user.key).count()
+        return {
+            'elapsed': elapsed,
+            'ended': expected['played'],
+            'failed': expected['failed'],
+            'lost_games': expected['played'] - user.total_games_played,
+            'lost_score': expected['score'] - user.total_game_score,
+            'missing_scores': expected['played'] - scores,
+            'active_drift': (len(games) - expected['played'] -
+                             counters.get_count(ACTIVE_GAMES_COUNTER)),
+        }
+    finally:
+        bed.deactivate()
+
+
+def main(threads, games_per_thread):
+    if threads * games_per_thread > MAX_ACTIVE_GAMES:
+        sys.exit('One user can have at most {} active games'.format(
+            MAX_ACTIVE_GAMES))
+    for name, end_game in (('transactional', lambda g, won: g.end_game(won)),
+                           ('legacy', legacy_end_game)):
+        result = run(end_game, threads, games_per_thread)
+        print('{:<14} {ended} ended, {failed} failed in {elapsed:.2f} s. '
+              'Lost updates: {lost_games} games played, {lost_score} score '
+              'on the user, {missing_scores} Scores'.format(name, **result))
+        if name == 'transactional':
+            print('{:<14} active games counter drift: {active_drift}'.format(
+                '', **result))
+            assert not (result['lost_games'] or result['lost_score'] or
+                        result['missing_scores'] or result['active_drift'])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 12)
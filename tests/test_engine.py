@@ -0,0 +1,102 @@
+"""test_engine.py - Tests of the game rules in engine.py, run without the App
+Engine SDK."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'Hangman'))
+
+import engine
+
+
+class EngineTest(unittest.TestCase):
+
+    def test_new_game_hides_every_letter(self):
+        state = engine.Engine('hangman', 8)
+        self.assertEqual(state.obscured_target, '$$$$$$$')
+        self.assertFalse(state.game_over)
+
+    def test_correct_guess_reveals_every_position(self):
+        state = engine.Engine('hangman', 8)
+        self.assertEqual(state.guess('a'), engine.CORRECT)
+        self.assertEqual(state.obscured_target, '$a$$$a$')
+        self.assertEqual(state.attempts_remaining, 8)
+
+    def test_wrong_guess_costs_an_attempt(self):
+        state = engine.Engine('hangman', 8)
+        self.assertEqual(state.guess('z'), engine.WRONG)
+        self.assertEqual(state.attempts_remaining, 7)
+
+    def test_guesses_are_case_insensitive(self):
+        state = engine.Engine('hangman', 8)
+        self.assertEqual(state.guess('H'), engine.CORRECT)
+        self.assertEqual(state.obscured_target, 'h$$$$$$')
+
+    def test_repeated_guesses_cost_nothing(self):
+        state = engine.Engine('hangman', 8)
+        state.guess('a')
+        state.guess('z')
+        self.assertEqual(state.guess('a'), engine.ALREADY_FOUND)
+        self.assertEqual(state.guess('z'), engine.ALREADY_TRIED)
+        self.assertEqual(state.attempts_remaining, 7)
+
+    def test_invalid_guesses(self):
+        state = engine.Engine('hangman', 8)
+        self.assertEqual(state.guess('ab'), engine.NOT_ONE_LETTER)
+        self.assertEqual(state.guess(''), engine.NOT_ONE_LETTER)
+        self.assertEqual(state.guess('1'), engine.NOT_A_LETTER)
+        self.assertEqual(state.attempts_remaining, 8)
+
+    def test_finding_every_letter_wins(self):
+        state = engine.Engine('abba', 8)
+        self.assertEqual(state.guess('a'), engine.CORRECT)
+        self.assertEqual(state.guess('b'), engine.WON)
+        self.assertTrue(state.game_over)
+        self.assertEqual(state.guess('c'), engine.GAME_OVER)
+
+    def test_running_out_of_attempts_loses(self):
+        state = engine.Engine('a', 2)
+        self.assertEqual(state.guess('b'), engine.WRONG)
+        self.assertEqual(state.guess('c'), engine.LOST)
+        self.assertTrue(state.game_over)
+        self.assertEqual(state.obscured_target, '$')
+
+    def test_letters_that_cant_be_guessed_are_shown(self):
+        state = engine.Engine("o'clock", 8)
+        self.assertEqual(state.obscured_target, "$'$$$$$")
+
+    def test_restore_from_guesses(self):
+        state = engine.Engine('hangman', 7, 'azn')
+        self.assertEqual(state.obscured_target, '$an$$an')
+        self.assertEqual(state.guess('z'), engine.ALREADY_TRIED)
+        self.assertEqual(state.guess('n'), engine.ALREADY_FOUND)
+
+    def test_restore_matches_replay(self):
+        played = engine.Engine('hangman', 8)
+        for letter in 'qhaz':
+            played.guess(letter)
+        restored = engine.Engine('hangman', played.attempts_remaining,
+                                 'qhaz', played.obscured_target)
+        for letter in 'gmn':
+            self.assertEqual(restored.guess(letter), played.guess(letter))
+        self.assertEqual(restored.obscured_target, played.obscured_target)
+        self.assertTrue(restored.game_over)
+
+    def test_restoring_a_finished_game(self):
+        self.assertTrue(engine.Engine('ab', 3, 'ab').game_over)
+        self.assertTrue(engine.Engine('ab', 0, 'xyz').game_over)
+
+    def test_score(self):
+        self.assertEqual(engine.score('hangman', True, 3), 21)
+        self.assertEqual(engine.score('hangman', False, 0), 0)
+
+    def test_mask(self):
+        self.assertEqual(engine.mask(''), 0)
+        self.assertEqual(engine.mask('ab'), 3)
+        self.assertEqual(engine.mask('aa'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""test_models.py - Tests of the transactions of models.py, run against the
+App Engine testbed stubs set up by benchmarks/gae.py. Skipped when the SDK
+can't be found."""
+
+import os
+import sys
+import unittest
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'benchmarks'))
+
+import gae
+
+SDK = gae.find_sdk()
+if SDK:
+    gae.setup_paths()
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+
+    import counters
+    import engine
+    import models
+    from models import User, Game, Score, ActiveGames, \
+        ACTIVE_GAMES_COUNTER, ACTIVE_ATTEMPTS_COUNTER
+
+
+@unittest.skipUnless(SDK, 'App Engine SDK not found')
+class GameTransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bed = gae.activate()
+        self.user = User.create('player')
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def new_games(self, *targets):
+        return models._create_games(self.user, list(targets)).get_result()
+
+    def totals(self):
+        """Returns the running totals of active games, from their shards"""
+        return (counters.get_stored_count(ACTIVE_GAMES_COUNTER),
+                counters.get_stored_count(ACTIVE_ATTEMPTS_COUNTER))
+
+    def active(self):
+        """Returns the keys of the games in the user's ActiveGames"""
+        summary = ActiveGames.key_for(self.user.key).get()
+        return [entry.game for entry in summary.games]
+
+    def queued(self, url):
+        stub = self.bed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        return stub.get_filtered_tasks(url=url)
+
+    def test_new_games_are_saved_with_summary_and_totals(self):
+        games = self.new_games('ab', 'cde')
+        self.assertEqual([game.key.get().target for game in games],
+                         ['ab', 'cde'])
+        self.assertEqual(self.active(), [game.key for game in games])
+        self.assertEqual(self.totals(), (2, 16))
+
+    def test_new_games_past_the_limit_save_nothing(self):
+        self.new_games(*['ab'] * (models.MAX_ACTIVE_GAMES - 1))
+        with self.assertRaises(models.TooManyGamesError):
+            self.new_games('cd', 'ef')
+        self.assertEqual(len(self.active()), models.MAX_ACTIVE_GAMES - 1)
+        self.assertEqual(Game.query(ancestor=self.user.key).count(),
+                         models.MAX_ACTIVE_GAMES - 1)
+        self.assertEqual(self.totals(), (models.MAX_ACTIVE_GAMES - 1,
+                                         8 * (models.MAX_ACTIVE_GAMES - 1)))
+
+    def test_new_games_of_several_users(self):
+        other = User.create('other')
+        games = Game.new_games([self.user, other], 2, 3, 3)
+        self.assertEqual(len(games), 4)
+        self.assertEqual(games[0].target, games[1].target)
+        self.assertEqual(games[2].target, games[3].target)
+        self.assertEqual([game.user for game in games],
+                         [self.user.key, other.key] * 2)
+        self.assertEqual(len(self.active()), 2)
+        self.assertEqual(self.totals(), (4, 32))
+
+    def test_end_game_saves_score_user_and_totals(self):
+        game, other = self.new_games('ab', 'cde')
+        score = game.end_game(won=True)
+
+        self.assertEqual(Score.query().fetch(), [score])
+        self.assertEqual(score.game_score, engine.score('ab', True, 8))
+        self.assertEqual(score.date, date.today())
+        user = self.user.key.get()
+        self.assertEqual((user.total_games_played, user.total_game_score),
+                         (1, score.game_score))
+        self.assertTrue(game.key.get().game_over)
+        self.assertEqual(self.active(), [other.key])
+        self.assertEqual(self.totals(), (1, 8))
+        self.assertEqual(len(self.queued('/tasks/update_leaderboards')), 1)
+
+    def test_end_game_counts_attempts_used_since_saved(self):
+        game, = self.new_games('ab')
+        game.apply_guess('z')
+        game.end_game(won=False)
+        self.assertEqual(self.totals(), (0, 0))
+
+    def test_games_ending_together_keep_every_score(self):
+        games = self.new_games('ab', 'cd', 'ef')
+        for game in games:
+            game.game_over = True
+        # All in one event loop, so the transactions on the user's entity
+        # group collide and are retried
+        futures = [models._end_game(game, True, 10, -game.attempts_remaining)
+                   for game in games]
+        ndb.Future.wait_all(futures)
+        for future in futures:
+            future.check_success()
+
+        user = self.user.key.get()
+        self.assertEqual((user.total_games_played, user.total_game_score),
+                         (3, 30))
+        self.assertEqual(Score.query().count(), 3)
+        self.assertEqual(self.active(), [])
+        self.assertEqual(self.totals(), (0, 0))
+
+    def test_cancel_deletes_game_and_untracks_it(self):
+        game, other = self.new_games('ab', 'cde')
+        game.apply_guess('z')
+        game.put_tracked()
+        self.assertEqual(self.totals(), (2, 15))
+
+        self.assertTrue(game.cancel())
+        self.assertIsNone(game.key.get())
+        self.assertEqual(self.active(), [other.key])
+        self.assertEqual(self.totals(), (1, 8))
+
+    def test_cancel_leaves_ended_games_alone(self):
+        game, = self.new_games('ab')
+        score = game.end_game(won=True)
+        self.assertFalse(game.cancel())
+        self.assertIsNotNone(game.key.get())
+        self.assertEqual(Score.query().fetch(), [score])
+        self.assertEqual(self.totals(), (0, 0))
+
+    def test_cancel_twice(self):
+        game, = self.new_games('ab')
+        self.assertTrue(game.cancel())
+        self.assertFalse(game.cancel())
+        self.assertEqual(self.totals(), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
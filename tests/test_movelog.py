@@ -0,0 +1,99 @@
+"""test_movelog.py - Round trip tests of the packed move logs of movelog.py,
+run without the App Engine SDK."""
+
+import os
+import string
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'Hangman'))
+
+import engine
+import movelog
+
+# A word using every letter, so its game has the longest log a game can have
+PANGRAM = string.ascii_lowercase
+MAX_TIME = 2 ** 32 - 1
+
+
+def play(target, guesses, attempts=8, when=0):
+    """Returns the log of a game played from scratch and its engine"""
+    state = engine.Engine(target, attempts)
+    log = ''
+    for letter in guesses:
+        outcome = state.guess(letter)
+        if outcome in engine.ACCEPTED:
+            log += movelog.record(letter, outcome, when)
+    return log, state
+
+
+class MoveLogTest(unittest.TestCase):
+
+    def test_empty_log(self):
+        self.assertEqual(movelog.count(''), 0)
+        self.assertEqual(movelog.letters(''), '')
+        self.assertEqual(list(movelog.moves('')), [])
+        self.assertEqual(movelog.initial_attempts('', 8), 8)
+        self.assertEqual(movelog.from_guesses('hangman', 8, ''), '')
+        self.assertEqual(movelog.replay('hangman', '', 8, 0).obscured_target,
+                         '$$$$$$$')
+
+    def test_record_round_trip(self):
+        log = (movelog.record('a', engine.CORRECT, 1500000000) +
+               movelog.record('z', engine.WRONG, 0))
+        self.assertEqual(movelog.count(log), 2)
+        self.assertEqual(len(log), 2 * movelog.RECORD.size)
+        self.assertEqual(movelog.letters(log), 'az')
+        self.assertEqual(list(movelog.moves(log)), [
+            ('a', engine.CORRECT, datetime.utcfromtimestamp(1500000000)),
+            ('z', engine.WRONG, None)])
+
+    def test_every_outcome_round_trips(self):
+        log = ''.join(movelog.record('a', outcome, 1)
+                      for outcome in movelog.OUTCOMES)
+        self.assertEqual([outcome for _, outcome, _ in movelog.moves(log)],
+                         list(movelog.OUTCOMES))
+
+    def test_largest_field_values(self):
+        log = movelog.record(chr(255), engine.LOST, MAX_TIME)
+        self.assertEqual(list(movelog.moves(log)), [
+            (chr(255), engine.LOST, datetime.utcfromtimestamp(MAX_TIME))])
+
+    def test_longest_game(self):
+        log, state = play(PANGRAM, PANGRAM, when=MAX_TIME)
+        self.assertTrue(state.game_over)
+        self.assertEqual(movelog.count(log), len(PANGRAM))
+        self.assertEqual(movelog.letters(log), PANGRAM)
+        outcomes = [outcome for _, outcome, _ in movelog.moves(log)]
+        self.assertEqual(outcomes, [engine.CORRECT] * 25 + [engine.WON])
+        self.assertEqual(movelog.from_guesses(PANGRAM, 8, PANGRAM),
+                         play(PANGRAM, PANGRAM)[0])
+        self.assertEqual(movelog.replay(PANGRAM, log, 8, 26).obscured_target,
+                         PANGRAM)
+
+    def test_slices(self):
+        log, _ = play('hangman', 'qhazgmn', when=1)
+        self.assertEqual([letter for letter, _, _ in
+                          movelog.moves(log, 2, 4)], ['a', 'z'])
+        self.assertEqual([letter for letter, _, _ in
+                          movelog.moves(log, 5, 100)], ['m', 'n'])
+        self.assertEqual(list(movelog.moves(log, 7)), [])
+
+    def test_initial_attempts_and_replay(self):
+        log, state = play('hangman', 'qhaz', attempts=6)
+        self.assertEqual(state.attempts_remaining, 4)
+        self.assertEqual(movelog.initial_attempts(log, 4), 6)
+        replayed = movelog.replay('hangman', log, 4, 3)
+        self.assertEqual(replayed.obscured_target, 'ha$$$a$')
+        self.assertEqual(replayed.attempts_remaining, 5)
+
+    def test_from_guesses_matches_played_log(self):
+        played, state = play('hangman', 'qhazgmn')
+        self.assertEqual(movelog.from_guesses(
+            'hangman', state.attempts_remaining, 'qhazgmn'), played)
+
+
+if __name__ == '__main__':
+    unittest.main()
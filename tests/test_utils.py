@@ -0,0 +1,61 @@
+"""test_utils.py - Tests of the helpers of utils.py, run against the App
+Engine testbed stubs set up by benchmarks/gae.py. Skipped when the SDK can't
+be found."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'benchmarks'))
+
+import gae
+
+SDK = gae.find_sdk()
+if SDK:
+    gae.setup_paths()
+    from google.appengine.ext import testbed
+
+    from models import User
+    from utils import add_named_task, next_batch
+
+
+@unittest.skipUnless(SDK, 'App Engine SDK not found')
+class UtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bed = gae.activate()
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def queued(self, url):
+        stub = self.bed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        return stub.get_filtered_tasks(url=url)
+
+    def test_named_task_is_queued_once(self):
+        add_named_task('export-users-0', '/tasks/bulk/export',
+                       {'name': 'users'})
+        add_named_task('export-users-0', '/tasks/bulk/export',
+                       {'name': 'users'})
+        add_named_task('export-users-1', '/tasks/bulk/export')
+        self.assertEqual(sorted(task.name for task in
+                                self.queued('/tasks/bulk/export')),
+                         ['export-users-0', 'export-users-1'])
+
+    def test_next_batch_walks_every_result(self):
+        for index in range(5):
+            User(name='player{}'.format(index)).put()
+        query = User.query().order(User.name)
+        names, cursor = [], None
+        while True:
+            users, cursor = next_batch(query, cursor, 2)
+            names.extend(user.name for user in users)
+            if cursor is None:
+                break
+        self.assertEqual(names, ['player{}'.format(index)
+                                 for index in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()